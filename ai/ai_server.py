@@ -18,9 +18,17 @@ import json
 import numpy as np
 import pandas as pd
 from collections import deque, defaultdict
-from ultralytics import YOLO
 import mediapipe as mp
-from sklearn.cluster import DBSCAN
+
+from appearance import FeatureBank
+from assignment import BACKENDS as ASSIGNMENT_BACKENDS, get_backend
+from capture import ThreadedCapture
+from head_pose import solve_head_pose
+from inference_backends import BACKENDS as INFERENCE_BACKENDS, load_yolo
+from clip_recorder import ClipRecorder
+from motion import BoxKalman, DetectionScheduler, motion_level
+from seat_map import SeatMap
+from stage_metrics import StageTimers
 
 # ------------------------
 # Helpers & defaults
@@ -34,30 +42,64 @@ DEFAULTS = {
     "persistence_frames": 5,        # must exceed for final flag
     "clip_pre_seconds": 3.0,
     "clip_post_seconds": 3.0,
-    "max_track_disappeared": 40,
+    "clip_merge_gap_seconds": 2.0,  # alerts closer than this share one clip
+    "clip_max_seconds": 30.0,
+    "buffer_mode": "auto",          # pre-roll storage: raw (preallocated slab) | jpeg (compressed) | auto (raw if it fits buffer_mb)
+    "buffer_mb": 256,               # memory budget for the pre-roll buffer
+    "buffer_scale": 1.0,            # downscale factor applied to buffered frames
+    "max_track_disappeared": 40,   # keyframes (detection passes), so the timeout in frames grows with the interval
     "max_distance": 140,
     "ema_alpha": 0.35,
     "cluster_interval": 300,
     "cluster_eps": 100,
-    "cluster_min_samples": 3
+    "cluster_min_samples": 3,
+    "reach_radius": 200,            # px between a hand point and a track centroid that counts as reaching
+    "seat_leave_distance": 160,     # px from the nearest learned seat that counts as "left seat"
+    "assignment": "hungarian",
+    "max_detect_interval": 6,
+    "motion_high": 0.02             # relative track speed (box diagonals/frame) that forces per-frame detection
 }
 
 # ------------------------
 # Parse args
 # ------------------------
 parser = argparse.ArgumentParser()
-parser.add_argument("--source", default=0, help="Camera index or video file/RTSP URL")
+parser.add_argument("--source", nargs="+", default=["0"],
+                    help="One or more camera indexes / video files / RTSP URLs (one tracker per source)")
+parser.add_argument("--names", nargs="+", default=None, help="Camera labels for alerts and files (default cam0, cam1, ...)")
 parser.add_argument("--model", default="yolov8m.pt", help="YOLO model")
+parser.add_argument("--backend", default="torch", choices=INFERENCE_BACKENDS,
+                    help="Inference backend for YOLO (onnx/openvino exports are created once and cached)")
+parser.add_argument("--int8", action="store_true", help="Use an INT8-quantized export (onnx/openvino)")
+parser.add_argument("--calib_data", default=None, help="Calibration dataset yaml for OpenVINO INT8 export")
+parser.add_argument("--threads", type=int, default=0, help="Intra-op inference threads (0 = runtime default)")
 parser.add_argument("--out_dir", default="results", help="Output folder for logs/screens/clips")
 parser.add_argument("--conf", type=float, default=DEFAULTS["conf_thresh"])
 parser.add_argument("--susp_thresh", type=float, default=DEFAULTS["suspicion_thresh"])
 parser.add_argument("--head_yaw_deg", type=float, default=DEFAULTS["head_yaw_deg"])
+parser.add_argument("--assignment", default=DEFAULTS["assignment"], choices=sorted(ASSIGNMENT_BACKENDS),
+                    help="Track/detection assignment backend")
+parser.add_argument("--buffer_mode", default=DEFAULTS["buffer_mode"], choices=["auto", "raw", "jpeg"])
+parser.add_argument("--buffer_mb", type=float, default=DEFAULTS["buffer_mb"], help="Pre-roll buffer memory budget (MB)")
+parser.add_argument("--buffer_scale", type=float, default=DEFAULTS["buffer_scale"], help="Downscale buffered frames (0-1]")
+parser.add_argument("--capture_policy", default="auto", choices=["auto", "latest", "queue"],
+                    help="Frame hand-off from the capture thread: newest frame only, or a bounded queue")
+parser.add_argument("--capture_queue", type=int, default=4, help="Queue length for --capture_policy queue")
+parser.add_argument("--capture_timeout", type=float, default=0.5,
+                    help="Seconds a tick waits for new frames; cameras with none are left out of that tick")
+parser.add_argument("--max_detect_interval", type=int, default=DEFAULTS["max_detect_interval"],
+                    help="Run YOLO at least every N frames; tracks are predicted in between (1 = every frame)")
+parser.add_argument("--target_fps", type=float, default=0.0, help="Loop rate to sustain (0 = source fps)")
+parser.add_argument("--room", default=None, help="Room name; its learned seat map is loaded at start and saved on exit")
+parser.add_argument("--metrics_interval", type=float, default=30.0,
+                    help="Seconds between structured per-stage latency logs (0 = off)")
 parser.add_argument("--debug", action="store_true")
 args = parser.parse_args()
 
 OUT_DIR = args.out_dir
 LOG_DIR = os.path.join(OUT_DIR, "logs"); os.makedirs(LOG_DIR, exist_ok=True)
 SCREEN_DIR = os.path.join(OUT_DIR, "screens"); os.makedirs(SCREEN_DIR, exist_ok=True)
+SEATMAP_DIR = os.path.join(OUT_DIR, "seatmaps")
 CLIP_DIR = os.path.join(OUT_DIR, "clips"); os.makedirs(CLIP_DIR, exist_ok=True)
 
 # Configurable parameters (exposed via CLI or constants)
@@ -67,27 +109,22 @@ SUSPICION_DECAY = DEFAULTS["suspicion_decay"]
 HEAD_YAW_DEG = args.head_yaw_deg
 REACH_FRAMES = DEFAULTS["reach_frames"]
 PERSISTENCE_FRAMES = DEFAULTS["persistence_frames"]
-MAX_DISAPPEARED = DEFAULTS["max_track_disappeared"]
+MAX_DISAPPEARED = DEFAULTS["max_track_disappeared"]   # counted in keyframes: match_and_update only runs on detection passes
 MAX_DISTANCE = DEFAULTS["max_distance"]
 EMA_ALPHA = DEFAULTS["ema_alpha"]
 CLUSTER_INTERVAL = DEFAULTS["cluster_interval"]
 CLUSTER_EPS = DEFAULTS["cluster_eps"]
 CLUSTER_MIN_SAMPLES = DEFAULTS["cluster_min_samples"]
+SEAT_LEAVE_DIST = DEFAULTS["seat_leave_distance"]
+REACH_RADIUS = DEFAULTS["reach_radius"]
 CLIP_PRE_SEC = DEFAULTS["clip_pre_seconds"]
 CLIP_POST_SEC = DEFAULTS["clip_post_seconds"]
+CLIP_MERGE_GAP_SEC = DEFAULTS["clip_merge_gap_seconds"]
+CLIP_MAX_SEC = DEFAULTS["clip_max_seconds"]
 
 # MediaPipe indices used for head pose estimation (approx)
 mp_face = mp.solutions.face_mesh
 mp_hands = mp.solutions.hands
-MP_IDX = {"nose":1,"chin":152,"le":33,"re":263,"ml":61,"mr":291}
-MODEL_3D = np.array([
-    (0.0, 0.0, 0.0),
-    (0.0, -330.0, -65.0),
-    (-225.0, 170.0, -135.0),
-    (225.0, 170.0, -135.0),
-    (-150.0, -150.0, -125.0),
-    (150.0, -150.0, -125.0)
-], dtype=np.float64)
 
 # ------------------------
 # Utility functions
@@ -96,6 +133,18 @@ def bbox_center(b):
     x1,y1,x2,y2 = b
     return (int((x1+x2)/2), int((y1+y2)/2))
 
+def camera_labels(sources, names=None):
+    if names:
+        if len(names) != len(sources):
+            raise SystemExit("--names needs one label per --source")
+        return list(names)
+    return [f"cam{i}" for i in range(len(sources))]
+
+def pairwise_sq_dist(a, b):
+    """Squared euclidean distances between rows of a [N,2] and b [M,2] -> [N,M]."""
+    diff = a[:, None, :] - b[None, :, :]
+    return np.einsum("ijk,ijk->ij", diff, diff)
+
 def crop_upper_torso(frame, bbox, fraction=0.5):
     x1,y1,x2,y2 = bbox
     h = y2 - y1
@@ -114,37 +163,6 @@ def color_hist_feature(img, bins=(8,8,8)):
     cv2.normalize(hist, hist)
     return hist.flatten()
 
-def hist_similarity(h1, h2):
-    if h1 is None or h2 is None:
-        return 0.0
-    return float(cv2.compareHist(h1.astype(np.float32), h2.astype(np.float32), cv2.HISTCMP_CORREL))
-
-def estimate_head_yaw(landmarks, image_size):
-    h,w = image_size
-    try:
-        pts2d = np.array([
-            (landmarks[MP_IDX["nose"]].x * w, landmarks[MP_IDX["nose"]].y * h),
-            (landmarks[MP_IDX["chin"]].x * w, landmarks[MP_IDX["chin"]].y * h),
-            (landmarks[MP_IDX["le"]].x * w, landmarks[MP_IDX["le"]].y * h),
-            (landmarks[MP_IDX["re"]].x * w, landmarks[MP_IDX["re"]].y * h),
-            (landmarks[MP_IDX["ml"]].x * w, landmarks[MP_IDX["ml"]].y * h),
-            (landmarks[MP_IDX["mr"]].x * w, landmarks[MP_IDX["mr"]].y * h)
-        ], dtype=np.float64)
-    except Exception:
-        return None
-    focal = w
-    center = (w/2, h/2)
-    cam = np.array([[focal,0,center[0]],[0,focal,center[1]],[0,0,1]], dtype=np.float64)
-    ok, rvec, tvec = cv2.solvePnP(MODEL_3D, pts2d, cam, np.zeros((4,1)), flags=cv2.SOLVEPNP_ITERATIVE)
-    if not ok:
-        return None
-    rmat, _ = cv2.Rodrigues(rvec)
-    proj = np.hstack((rmat, tvec))
-    _, _, _, _, _, _, euler = cv2.decomposeProjectionMatrix(proj)
-    # euler[1] is yaw (degrees)
-    yaw_val = float(euler[1].item()) if hasattr(euler[1],'item') else float(euler[1])
-    return yaw_val
-
 # ------------------------
 # Tracker class (appearance + centroid + EMA smoothing)
 # ------------------------
@@ -153,7 +171,6 @@ class Track:
         self.id = tid
         self.bbox = bbox
         self.centroid = np.array(bbox_center(bbox), dtype=float)
-        self.centroid_ema = self.centroid.copy()
         self.feature = feature
         self.last_seen = frame_idx
         self.disappeared = 0
@@ -161,13 +178,14 @@ class Track:
         self.ema_yaw = 0.0
         self.consec_suspicious = 0
         self.reach_count = 0
+        self.kf = BoxKalman(bbox)
+        self.head_pose = None
         # buffer for saving short per-track history if needed (not per-track video but global buffer used)
     def update(self, bbox, feature, frame_idx):
         self.bbox = bbox
+        self.kf.correct(bbox)
         c = np.array(bbox_center(bbox), dtype=float)
         self.centroid = c
-        # EMA for centroid
-        self.centroid_ema = EMA_ALPHA * c + (1.0 - EMA_ALPHA) * self.centroid_ema
         # update appearance feature with simple average to be tolerant
         if feature is not None and self.feature is not None:
             self.feature = 0.6 * self.feature + 0.4 * feature
@@ -175,21 +193,36 @@ class Track:
             self.feature = feature
         self.last_seen = frame_idx
         self.disappeared = 0
+    def predict(self):
+        if self.disappeared > 0:
+            # missed at the last keyframe: hold the last box instead of letting a ghost drift away
+            self.kf.hold()
+        self.bbox = self.kf.predict()
+        self.centroid = np.array(bbox_center(self.bbox), dtype=float)
 
 class AppearanceTracker:
-    def __init__(self):
+    def __init__(self, assignment="hungarian"):
+        self.assign = get_backend(assignment)
         self.next_id = 1
         self.tracks = dict()
+        self.bank = FeatureBank()   # contiguous float32 copy of track features for batched similarity
 
     def register(self, bbox, feature, frame_idx):
         t = Track(self.next_id, bbox, feature, frame_idx)
         self.tracks[self.next_id] = t
+        self.bank.set(t.id, feature)
         self.next_id += 1
         return t
 
     def deregister(self, tid):
         if tid in self.tracks:
             del self.tracks[tid]
+            self.bank.remove(tid)
+
+    def predict(self):
+        """Propagate all tracks one frame with their motion model (no detections needed)."""
+        for t in self.tracks.values():
+            t.predict()
 
     def match_and_update(self, detections, features, frame_idx):
         """
@@ -214,20 +247,16 @@ class AppearanceTracker:
             return self.tracks
 
         track_ids = list(self.tracks.keys())
-        track_centroids = np.array([self.tracks[tid].centroid_ema for tid in track_ids], dtype=float)
+        # gate on the motion model's prediction for this frame (predict() ran in next_frame), not the
+        # last detection's EMA, which lags by every frame coasted since the previous keyframe
+        track_centroids = np.array([self.tracks[tid].kf.x[:2] for tid in track_ids], dtype=float)
 
         # distance matrix
         D = np.linalg.norm(track_centroids[:,None,:] - det_centroids[None,:,:], axis=2)
 
         # appearance similarity matrix (higher better)
-        A = np.zeros_like(D)
-        for i, tid in enumerate(track_ids):
-            tfeat = self.tracks[tid].feature
-            for j, feat in enumerate(features):
-                if tfeat is None or feat is None:
-                    A[i,j] = 0.0
-                else:
-                    A[i,j] = hist_similarity(tfeat, feat)
+        C, valid = self.bank.correlation(track_ids, features)
+        A = np.where(valid, C, 0.0)
 
         # combine normalized distance and appearance to a matching score
         # convert distances into similarity [0,1] via max distance
@@ -236,44 +265,27 @@ class AppearanceTracker:
         # weight appearance more if available
         score = 0.55 * A + 0.45 * sim_dist
 
-        # greedy match highest score
-        assigned_tracks = set()
-        assigned_dets = set()
-        matches = []
-        for _ in range(min(score.shape[0], score.shape[1])):
-            i,j = divmod(score.argmax(), score.shape[1])
-            if score[i,j] <= 0.2:
-                break
-            if i in assigned_tracks or j in assigned_dets:
-                score[i,j] = -1
-                continue
-            # enforce distance threshold for safety
-            if D[i,j] > MAX_DISTANCE:
-                score[i,j] = -1
-                continue
-            assigned_tracks.add(i); assigned_dets.add(j)
-            matches.append((track_ids[i], j))
-            score[i,:] = -1
-            score[:,j] = -1
+        # gated optimal assignment (det index -> track row); pairs beyond MAX_DISTANCE are never matched
+        det_to_row = self.assign(score, D <= MAX_DISTANCE, min_score=0.2)
 
         # update matched
-        for tid, j in matches:
+        for j, i in det_to_row.items():
+            tid = track_ids[i]
             self.tracks[tid].update(detections[j], features[j], frame_idx)
+            self.bank.set(tid, self.tracks[tid].feature)
 
         # unmatched tracks -> increment disappeared
-        for idx, tid in enumerate(track_ids):
-            if idx not in [m[0] for m in [(track_ids.index(x),y) for x,y in matches] if _ is not None] and idx not in [track_ids.index(tid) for tid,_ in matches]:
-                # simpler: check if this index maps in matches
-                if all(tid != m[0] for m in matches):
-                    t = self.tracks.get(tid)
-                    if t:
-                        t.disappeared += 1
-                        if t.disappeared > MAX_DISAPPEARED:
-                            self.deregister(tid)
+        matched_rows = set(det_to_row.values())
+        for i, tid in enumerate(track_ids):
+            if i not in matched_rows:
+                t = self.tracks[tid]
+                t.disappeared += 1
+                if t.disappeared > MAX_DISAPPEARED:
+                    self.deregister(tid)
 
         # unmatched detections -> register
         for j, bbox in enumerate(detections):
-            if j not in set(j for _, j in matches):
+            if j not in det_to_row:
                 self.register(bbox, features[j], frame_idx)
 
         return self.tracks
@@ -282,64 +294,178 @@ class AppearanceTracker:
 # Clip buffer (global frame circular buffer)
 # ------------------------
 class FrameBuffer:
-    def __init__(self, maxlen_frames=300):
-        self.buf = deque(maxlen=maxlen_frames)
+    """
+    Recent frames for alert pre-roll, bounded by frame count and by memory.
+    mode "jpeg": frames are JPEG-encoded on push and only decoded when a clip is written
+    mode "raw":  frames are copied into one preallocated slab (no per-frame allocation)
+    mode "auto": "raw" when the budget holds maxlen_frames, else "jpeg" (decided on the first push)
+    scale < 1 downsizes frames before they are stored.
+    Raw payloads are references into the slab: decode() copies them on the recorder thread and returns
+    None for a slot that was recycled before it got there.
+    """
+    def __init__(self, maxlen_frames=300, budget_mb=256, mode="auto", scale=1.0, jpeg_quality=85):
+        if mode not in ("auto", "jpeg", "raw"):
+            raise ValueError(f"Unknown frame buffer mode: {mode}")
+        self.maxlen = maxlen_frames
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.mode = mode
+        self.scale = scale
+        self.jpeg_quality = jpeg_quality
+        self.buf = deque()          # (ts, payload): encoded bytes ("jpeg") or slab slot ("raw")
+        self.nbytes = 0
+        self.slab = None
+        self.stamps = None          # ts held by each slab slot; -1 while it is being overwritten
+        self._slot = 0
+    def _shrink(self, frame):
+        if self.scale == 1.0:
+            return frame
+        return cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
     def push(self, frame):
-        self.buf.append((time.time(), frame.copy()))
+        ts = time.time()
+        small = self._shrink(frame)
+        if self.mode == "auto":
+            # a copy per frame is far cheaper than an imencode per frame, so only compress when raw won't fit
+            self.mode = "raw" if small.nbytes * self.maxlen <= self.budget else "jpeg"
+            print(f"FrameBuffer: {self.mode} mode ({small.nbytes * self.maxlen / 2**20:.0f} MB raw for {self.maxlen} frames)")
+        if self.mode == "raw":
+            if self.slab is None or self.slab.shape[1:] != small.shape:
+                cap = max(1, min(self.maxlen, self.budget // small.nbytes))
+                if cap < self.maxlen:
+                    print(f"FrameBuffer: memory budget holds {cap} of {self.maxlen} frames")
+                self.slab = np.empty((cap,) + small.shape, dtype=np.uint8)
+                self.stamps = [-1.0] * cap
+                self.nbytes = self.slab.nbytes
+                self.buf.clear()
+                self._slot = 0
+            slot = self._slot
+            self._slot = (slot + 1) % len(self.slab)
+            self.stamps[slot] = -1.0
+            np.copyto(self.slab[slot], small)
+            self.stamps[slot] = ts
+            if len(self.buf) == len(self.slab):
+                self.buf.popleft()
+            self.buf.append((ts, slot))
+        else:
+            ok, enc = cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if ok:
+                self.buf.append((ts, enc))
+                self.nbytes += enc.nbytes
+            while len(self.buf) > self.maxlen or (self.nbytes > self.budget and len(self.buf) > 1):
+                _, old = self.buf.popleft()
+                self.nbytes -= old.nbytes
+        return ts
+    def _payload(self, ts, item):
+        # no copy on the capture loop: the slab (kept alive by the reference) is read later by decode()
+        return (self.slab, self.stamps, item, ts) if self.mode == "raw" else item
+    def decode(self, payload):
+        """Turn a payload from get_last_n / get_all back into a BGR frame (None if its raw slot was recycled)."""
+        if self.mode == "raw":
+            slab, stamps, slot, ts = payload
+            if stamps[slot] != ts:
+                return None
+            frame = slab[slot].copy()
+            # a push that started during the copy has already cleared the stamp
+            return frame if stamps[slot] == ts else None
+        return cv2.imdecode(payload, cv2.IMREAD_COLOR)
     def get_last_n(self, seconds):
         now = time.time()
         out = []
-        for ts, f in reversed(self.buf):
+        for ts, item in reversed(self.buf):
             if now - ts <= seconds:
-                out.append((ts, f))
+                out.append((ts, self._payload(ts, item)))
             else:
                 break
         return list(reversed(out))
     def get_all(self):
-        return list(self.buf)
+        return [(ts, self._payload(ts, item)) for ts, item in self.buf]
 
 # ------------------------
-# Main detection loop
+# Per-camera state
 # ------------------------
-def main_loop(source):
-    print("Loading model:", args.model)
-    model = YOLO(args.model)
-    cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
-    if not cap.isOpened():
-        raise RuntimeError("Cannot open video source: " + str(source))
-
-    face_mesh = mp_face.FaceMesh(static_image_mode=False, max_num_faces=6, refine_landmarks=True,
-                                 min_detection_confidence=0.5, min_tracking_confidence=0.5)
-    hands = mp_hands.Hands(static_image_mode=False, max_num_hands=4,
-                           model_complexity=1, min_detection_confidence=0.5, min_tracking_confidence=0.5)
-
-    tracker = AppearanceTracker()
-    fb = FrameBuffer(maxlen_frames=int((CLIP_PRE_SEC + CLIP_POST_SEC + 5) * 30))  # keep a safe buffer (~fps 30)
-    frame_idx = 0
-    csv_rows = []
-    all_centroids = []
-    clusters = []
-    last_cluster_time = 0
-    fps_est = None
-
-    print("Starting main loop. Press 'q' to quit.")
-    while True:
-        start = time.time()
-        ret, frame = cap.read()
+class CameraStream:
+    """
+    Everything that belongs to one camera: capture, tracker, pre-roll buffer,
+    clip recorder, seat map, detection cadence and its own FaceMesh / Hands graphs
+    (they track landmarks across frames, so they cannot be shared between cameras).
+    """
+    def __init__(self, label, source, room=None):
+        self.label = label
+        self.cap = ThreadedCapture(source, policy=args.capture_policy, queue_size=args.capture_queue)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Cannot open video source for {label}: {source}")
+
+        self.face_mesh = mp_face.FaceMesh(static_image_mode=False, max_num_faces=6, refine_landmarks=True,
+                                          min_detection_confidence=0.5, min_tracking_confidence=0.5)
+        self.hands = mp_hands.Hands(static_image_mode=False, max_num_hands=4,
+                                    model_complexity=1, min_detection_confidence=0.5, min_tracking_confidence=0.5)
+
+        self.tracker = AppearanceTracker(assignment=args.assignment)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self.fb = FrameBuffer(maxlen_frames=int((CLIP_PRE_SEC + 1) * min(self.fps, 60.0)),  # only the pre-roll is read back
+                              budget_mb=args.buffer_mb, mode=args.buffer_mode, scale=args.buffer_scale)
+        # frames waiting for the clip writer share the pre-roll's memory budget
+        self.recorder = ClipRecorder(post_sec=CLIP_POST_SEC, merge_gap_sec=CLIP_MERGE_GAP_SEC, max_clip_sec=CLIP_MAX_SEC,
+                                     max_bytes=int(args.buffer_mb * 2**20))
+        self.scheduler = DetectionScheduler(target_fps=args.target_fps or self.fps, max_interval=args.max_detect_interval,
+                                            motion_high=DEFAULTS["motion_high"])
+        self.frame_idx = 0
+        self.seat_map = SeatMap(eps=CLUSTER_EPS, min_samples=CLUSTER_MIN_SAMPLES)
+        self.room = room
+        self.seat_map_path = os.path.join(SEATMAP_DIR, f"{room}.json") if room else None
+        if self.seat_map_path and self.seat_map.load(self.seat_map_path):
+            print(f"[{label}] Loaded seat map for room {room}: {len(self.seat_map.seats)} seats")
+        self.last_cluster_time = 0
+        self.fps_est = None
+        self.timers = StageTimers()
+        self.stalled = 0    # consecutive ticks without a new frame
+        self.stalled_ticks = 0
+
+        # current frame
+        self.frame = None
+        self.frame_ts = None
+        self.disp = None
+
+    def next_frame(self, timeout=None):
+        """
+        Read and buffer the next frame, advance the motion models. False when no frame arrived
+        within `timeout` or the stream has ended (cap.ended() tells which).
+        """
+        with self.timers.time("capture"):
+            ret, frame = self.cap.read(timeout=timeout)
         if not ret:
-            print("Stream ended.")
-            break
-        frame_idx += 1
-        fb.push(frame)
+            if not self.cap.ended():
+                if not self.stalled:
+                    print(f"[{self.label}] No frame within {timeout:.2f}s, skipping it until it recovers")
+                self.stalled += 1
+                self.stalled_ticks += 1
+            return False
+        if self.stalled:
+            print(f"[{self.label}] Stream recovered after {self.stalled} skipped ticks")
+            self.stalled = 0
+        self.frame_idx += 1
+        self.frame = frame
+        with self.timers.time("buffer"):
+            self.frame_ts = self.fb.push(frame)
+            # post-roll for any open alert clip is written on the recorder thread
+            self.recorder.feed(self.frame_ts, frame)
+        self.disp = frame.copy()
+        # advance every track's motion model; between keyframes the prediction is the track box
+        with self.timers.time("predict"):
+            self.tracker.predict()
+        return True
+
+    def wants_detection(self):
+        return self.scheduler.should_detect(len(self.tracker.tracks))
+
+    def update_detections(self, result):
+        """Feed one YOLO result (for this stream's current frame) into the tracker."""
+        frame = self.frame
         h, w = frame.shape[:2]
-        disp = frame.copy()
-
-        # YOLO detect people
-        results = model.predict(frame, imgsz=640, conf=CONF_THRESH, classes=[0], verbose=False)
+        t_features = time.perf_counter()
         dets = []
         det_features = []
-        if results and hasattr(results[0], "boxes"):
-            for box in results[0].boxes:
+        if result is not None and hasattr(result, "boxes"):
+            for box in result.boxes:
                 conf = float(box.conf[0].cpu().numpy())
                 if conf < CONF_THRESH:
                     continue
@@ -354,28 +480,40 @@ def main_loop(source):
                 feat = color_hist_feature(crop)
                 det_features.append(feat)
                 # draw light rectangle
-                cv2.rectangle(disp, (x1,y1), (x2,y2), (120,200,120), 1)
+                cv2.rectangle(self.disp, (x1,y1), (x2,y2), (120,200,120), 1)
+
+        self.timers.record("features", time.perf_counter() - t_features)
 
         # Update tracker (appearance + centroid)
-        tracks = tracker.match_and_update(dets, det_features, frame_idx)
-
-        # Periodically learn clusters (approx seat positions) from long-term centroids for "leaving seat" logic
-        if frame_idx - last_cluster_time > CLUSTER_INTERVAL:
-            # collect centroids across tracks
-            all_centroids.extend([t.centroid.tolist() for t in tracks.values()])
-            if len(all_centroids) >= CLUSTER_MIN_SAMPLES:
-                try:
-                    X = np.array(all_centroids)
-                    db = DBSCAN(eps=CLUSTER_EPS, min_samples=CLUSTER_MIN_SAMPLES).fit(X)
-                    clusters = [X[db.labels_==i].mean(axis=0) for i in set(db.labels_) if i!=-1]
-                except Exception as e:
-                    if args.debug: print("Cluster error:", e)
-            last_cluster_time = frame_idx
+        with self.timers.time("tracking"):
+            self.tracker.match_and_update(dets, det_features, frame_idx=self.frame_idx)
+
+    def analyse(self, csv_rows, start):
+        """Landmarks, per-track scoring, alerts and overlay for the current frame."""
+        frame, disp, frame_idx, tracker = self.frame, self.disp, self.frame_idx, self.tracker
+        tracks = tracker.tracks
+        h, w = frame.shape[:2]
+
+        # Periodically fold current centroids into the seat map (approx seat positions) for "leaving seat" logic
+        if frame_idx == 1:
+            self.seat_map.set_frame_size(w, h)
+        # only tracks matched at the last keyframe are scored; missed ones keep their state until
+        # they are matched again or expire, but never feed seats, reach or face association
+        track_list = [(tid, t) for tid, t in tracks.items() if t.disappeared == 0]
+        if frame_idx - self.last_cluster_time > CLUSTER_INTERVAL:
+            self.seat_map.observe([t.centroid for _, t in track_list])
+            self.last_cluster_time = frame_idx
+
+        # distance of every track to its nearest learned seat, in one query
+        track_c = np.array([t.centroid for _, t in track_list], dtype=float).reshape(-1, 2)
+        seat_dist = self.seat_map.nearest_distance(track_c)
 
         # Process face/hand landmarks
         rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        face_res = face_mesh.process(rgb)
-        hand_res = hands.process(rgb)
+        with self.timers.time("facemesh"):
+            face_res = self.face_mesh.process(rgb)
+        with self.timers.time("hands"):
+            hand_res = self.hands.process(rgb)
 
         # Precompute face centroid list and landmarks
         faces = []
@@ -390,42 +528,52 @@ def main_loop(source):
         if hand_res and hand_res.multi_hand_landmarks:
             for hms in hand_res.multi_hand_landmarks:
                 pts = [(int(p.x * w), int(p.y * h)) for p in hms.landmark]
-                hands_pts.append(pts)
-
-        # Evaluate each track for suspicious behavior
-        for tid, t in list(tracker.tracks.items()):
+                hands_pts.extend(pts)
+
+        # track <-> face / hand geometry for all tracks at once (squared distances, no per-point Python loop)
+        nearest_face = np.zeros(len(track_list), dtype=int)
+        if faces and len(track_list):
+            face_c = np.array([c for _, c in faces], dtype=float)
+            nearest_face = pairwise_sq_dist(track_c, face_c).argmin(axis=1)
+        # head pose: one solve per face that some track maps to. It is warm-started only when a single
+        # track maps to the face; with several the guess could be another person's pose, so it solves cold.
+        face_poses = {}
+        if faces and len(track_list):
+            tracks_by_face = {}
+            for k, (_, t) in enumerate(track_list):
+                tracks_by_face.setdefault(int(nearest_face[k]), []).append(t)
+            guess_by_face = {i: ts[0].head_pose if len(ts) == 1 else None for i, ts in tracks_by_face.items()}
+            with self.timers.time("pose"):
+                for i, guess in guess_by_face.items():
+                    face_poses[i] = solve_head_pose(faces[i][0], (h, w), guess=guess)
+        # reaching detection: any hand point within REACH_RADIUS of the track centroid
+        reach = np.zeros(len(track_list), dtype=bool)
+        if hands_pts and len(track_list):
+            hand_p = np.array(hands_pts, dtype=float)
+            reach = (pairwise_sq_dist(track_c, hand_p) < REACH_RADIUS ** 2).any(axis=1)
+
+        # Evaluate each track for suspicious behavior (scoring, drawing and alert evidence)
+        t_scoring = time.perf_counter()
+        for k, (tid, t) in enumerate(track_list):
             # find nearest face (if any)
             yaw = 0.0
             if faces:
-                # choose nearest face centroid
-                face_lms, face_c = min(faces, key=lambda f: np.hypot(f[1][0] - t.centroid[0], f[1][1] - t.centroid[1]))
-                hyaw = estimate_head_yaw(face_lms, (h, w))
-                if hyaw is not None:
+                # nearest face centroid (precomputed above)
+                pose = face_poses.get(int(nearest_face[k]))
+                if pose is not None:
+                    t.head_pose = pose
                     # EMA for yaw
-                    t.ema_yaw = EMA_ALPHA * hyaw + (1 - EMA_ALPHA) * t.ema_yaw
+                    t.ema_yaw = EMA_ALPHA * pose.yaw + (1 - EMA_ALPHA) * t.ema_yaw
                     yaw = t.ema_yaw
 
-            # reaching detection: if any hand point is near the track centroid (and not near their own upper-torso box center),
-            # increment reach_count. We use a radius threshold.
-            reach_detected = False
-            for hp in hands_pts:
-                for px, py in hp:
-                    if np.hypot(px - t.centroid[0], py - t.centroid[1]) < 200:
-                        reach_detected = True
-                        break
-                if reach_detected:
-                    break
-            if reach_detected:
+            # reaching detection: if any hand point is near the track centroid, increment reach_count
+            if reach[k]:
                 t.reach_count += 1
             else:
                 t.reach_count = max(0, t.reach_count - 1)
 
-            # compute distance to nearest learned cluster (if available)
-            left_cluster = False
-            if clusters:
-                dmin = min(np.linalg.norm(t.centroid - np.array(c)) for c in clusters)
-                if dmin > 160:
-                    left_cluster = True
+            # far from the nearest learned seat (inf, i.e. never, until seats are learned)
+            left_cluster = np.isfinite(seat_dist[k]) and seat_dist[k] > SEAT_LEAVE_DIST
 
             # Build score delta (heuristic)
             delta = 0.0
@@ -457,75 +605,170 @@ def main_loop(source):
             # If fully flagged (suspicion + persistence), log and save evidence
             if t.suspicion > SUSPICION_THRESH and t.consec_suspicious >= PERSISTENCE_FRAMES:
                 now_ts = time.strftime("%Y%m%d_%H%M%S")
-                print(f"[ALERT] track {tid} suspicion={t.suspicion:.1f} frame={frame_idx} time={now_ts}")
+                print(f"[ALERT] camera {self.label} track {tid} suspicion={t.suspicion:.1f} frame={frame_idx} time={now_ts}")
                 # CSV row
                 csv_rows.append({
                     "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+                    "camera": self.label,
                     "frame": frame_idx,
                     "track_id": tid,
                     "suspicion": round(t.suspicion, 2)
                 })
                 # Save screenshot (annotated)
-                shot_name = f"alert_{now_ts}_f{frame_idx}_id{tid}.jpg"
+                shot_name = f"alert_{self.label}_{now_ts}_f{frame_idx}_id{tid}.jpg"
                 shot_path = os.path.join(SCREEN_DIR, shot_name)
-                cv2.imwrite(shot_path, disp)
-
-                # Save short clip: collect pre-buffer frames from fb, then write next clip_post frames
-                try:
-                    prebuf = fb.get_last_n(CLIP_PRE_SEC)
-                    # determine fps (estimate)
-                    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
-                    post_frames = int(CLIP_POST_SEC * fps)
-                    clip_name = f"alert_{now_ts}_f{frame_idx}_id{tid}.mp4"
-                    clip_path = os.path.join(CLIP_DIR, clip_name)
-                    # Get frame size
-                    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                    out = cv2.VideoWriter(clip_path, fourcc, fps, (w, h))
-                    # write pre buffer
-                    for ts, pf in prebuf:
-                        out.write(pf)
-                    # write current frame
-                    out.write(frame)
-                    # write next post frames synchronously
-                    written = 0
-                    while written < post_frames:
-                        ret2, f2 = cap.read()
-                        if not ret2:
-                            break
-                        fb.push(f2)
-                        out.write(f2)
-                        written += 1
-                    out.release()
-                    print(f"Saved clip {clip_path} (pre {len(prebuf)} frames, post {written})")
-                except Exception as e:
-                    print("Clip saving error:", e)
+                with self.timers.time("disk_write"):
+                    cv2.imwrite(shot_path, disp)
+
+                # Save short clip: pre-buffer now, post-roll fed from the loop without blocking detection
+                clip_path = os.path.join(CLIP_DIR, f"alert_{self.label}_{now_ts}_f{frame_idx}_id{tid}.mp4")
+                # clip size follows the live frames fed as post-roll, not the (possibly downscaled) pre-roll
+                clip_path = self.recorder.trigger(clip_path, self.fb.get_last_n(CLIP_PRE_SEC), self.frame_ts,
+                                                  self.fps_est or self.fps, decode=self.fb.decode,
+                                                  size=(self.frame.shape[1], self.frame.shape[0]))
+                print(f"Recording clip {clip_path}")
 
                 # Damp suspicion to avoid repeated saves
                 t.suspicion *= 0.25
                 t.consec_suspicious = 0
 
+        self.timers.record("scoring", time.perf_counter() - t_scoring)
+
         # show approximate fps
         end = time.time()
-        if fps_est is None:
-            fps_est = 1.0 / max(1e-6, end - start)
+        if self.fps_est is None:
+            self.fps_est = 1.0 / max(1e-6, end - start)
         else:
-            fps_est = 0.9 * fps_est + 0.1 * (1.0 / max(1e-6, end - start))
-        cv2.putText(disp, f"FPS:{fps_est:.1f}", (10,20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200,200,0), 2)
-
-        cv2.imshow("auto-cheat-improved", disp)
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord('q'):
-            print("Stopping by user.")
-            break
+            self.fps_est = 0.9 * self.fps_est + 0.1 * (1.0 / max(1e-6, end - start))
+        self.scheduler.observe(self.fps_est, motion_level(tracks.values()))
+        cv2.putText(disp, f"{self.label} FPS:{self.fps_est:.1f} dropped:{self.cap.dropped} det/{self.scheduler.interval}",
+                    (10,20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200,200,0), 2)
+        with self.timers.time("display"):
+            cv2.imshow(f"auto-cheat-improved [{self.label}]", disp)
+
+    def metrics_record(self):
+        """One structured log record: this camera's stage latencies and counters since start."""
+        return {
+            "event": "stage_latency",
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "camera": self.label,
+            "frames": self.frame_idx,
+            "fps": round(self.fps_est or 0.0, 2),
+            "tracks": len(self.tracker.tracks),
+            "captureDropped": self.cap.dropped,
+            "captureStalls": self.stalled_ticks,
+            "clipFramesDropped": self.recorder.dropped_frames,
+            "detectInterval": self.scheduler.interval,
+            "stages": self.timers.summary(),
+        }
+
+    def close(self):
+        if self.seat_map_path:
+            self.seat_map.save(self.seat_map_path)
+            print(f"[{self.label}] Saved seat map for room {self.room}: {len(self.seat_map.seats)} seats")
+        sched = self.scheduler
+        print(f"[{self.label}] Detection ran on {sched.keyframes} keyframes, {sched.predicted} frames predicted")
+        cs = self.cap.stats()
+        print(f"[{self.label}] Capture ({cs['policy']}): decoded {cs['decoded']}, processed {cs['processed']}, dropped {cs['dropped']}")
+        self.recorder.close()
+        if self.recorder.dropped_frames or self.recorder.lost_preroll:
+            print(f"[{self.label}] Clip recorder dropped {self.recorder.dropped_frames} frames, "
+                  f"lost {self.recorder.lost_preroll} pre-roll frames")
+        self.cap.release()
 
-    # Save CSV log
-    if csv_rows:
-        csv_path = os.path.join(LOG_DIR, f"alerts_{time.strftime('%Y%m%d_%H%M%S')}.csv")
-        pd.DataFrame(csv_rows).to_csv(csv_path, index=False)
-        print("Saved CSV:", csv_path)
+# ------------------------
+# Main detection loop
+# ------------------------
+def log_metrics(streams, loop_timers, path):
+    """Print one JSON line per camera plus one for the shared loop, and append them to `path`."""
+    records = [st.metrics_record() for st in streams]
+    records.append({"event": "stage_latency", "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "camera": None, "stages": loop_timers.summary()})
+    lines = [json.dumps(r) for r in records]
+    for line in lines:
+        print(line, flush=True)
+    with open(path, "a") as f:
+        f.write("\n".join(lines) + "\n")
+
+def main_loop(sources, labels):
+    print("Loading model:", args.model)
+    # one model shared by every camera; a dynamic batch axis when several cameras share a predict
+    model = load_yolo(args.model, backend=args.backend, imgsz=640, int8=args.int8, threads=args.threads or None,
+                      batch=len(sources), calib_data=args.calib_data)
+    print("Inference backend:", model.backend_name)
+    multi = len(sources) > 1
+    streams = []
+    for label, source in zip(labels, sources):
+        # with several cameras each one learns its own seats
+        room = (f"{args.room}_{label}" if multi else args.room) if args.room else None
+        streams.append(CameraStream(label, source, room=room))
+    csv_rows = []
+    # batched detection and the whole tick are shared by every camera, so they are timed here
+    loop_timers = StageTimers()
+    metrics_path = os.path.join(LOG_DIR, f"metrics_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+    next_metrics = time.monotonic() + args.metrics_interval
+
+    print(f"Starting main loop on {len(streams)} camera(s). Press 'q' to quit.")
+    active = list(streams)
+    # seat maps, alerts and clips are saved however the loop ends (q, end of streams, Ctrl-C or an error)
+    try:
+        while active:
+            start = time.time()
+            tick_start = time.perf_counter()
+            # one stalled camera must not hold up the others: every read shares the tick's deadline,
+            # and a camera that already stalled is only polled until it delivers again
+            deadline = time.monotonic() + args.capture_timeout
+            all_stalled = all(st.stalled for st in active)
+            ready = []
+            for st in list(active):
+                wait = 0.0 if st.stalled and not all_stalled else max(0.0, deadline - time.monotonic())
+                if st.next_frame(timeout=wait):
+                    ready.append(st)
+                elif st.cap.ended():
+                    print(f"[{st.label}] Stream ended.")
+                    active.remove(st)
+            if not active:
+                break
 
-    cap.release()
-    cv2.destroyAllWindows()
+            # YOLO detect people: keyframes of every camera go through one batched predict per tick
+            batch = [st for st in ready if st.wants_detection()]
+            if batch:
+                with loop_timers.time("detect"):
+                    results = model.predict([st.frame for st in batch], imgsz=640, conf=CONF_THRESH, classes=[0], verbose=False)
+                for st, result in zip(batch, results):
+                    st.update_detections(result)
+
+            for st in ready:
+                st.analyse(csv_rows, start)
+            loop_timers.record("tick", time.perf_counter() - tick_start)
+
+            if args.metrics_interval > 0 and time.monotonic() >= next_metrics:
+                log_metrics(streams, loop_timers, metrics_path)
+                next_metrics = time.monotonic() + args.metrics_interval
+
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
+                print("Stopping by user.")
+                break
+    except KeyboardInterrupt:
+        print("Stopping on interrupt.")
+    finally:
+        # seat maps first: they are the slowest state to rebuild
+        for st in streams:
+            try:
+                st.close()
+            except Exception as e:
+                print(f"[{st.label}] Error while closing: {e}")
+
+        if args.metrics_interval > 0:
+            log_metrics(streams, loop_timers, metrics_path)
+
+        # Save CSV log
+        if csv_rows:
+            csv_path = os.path.join(LOG_DIR, f"alerts_{time.strftime('%Y%m%d_%H%M%S')}.csv")
+            pd.DataFrame(csv_rows).to_csv(csv_path, index=False)
+            print("Saved CSV:", csv_path)
+        cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    main_loop(args.source)
+    main_loop(args.source, camera_labels(args.source, args.names))
@@ -4,19 +4,35 @@ import time
 import cv2
 import numpy as np
 import base64
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-from io import BytesIO
-from PIL import Image
-import mediapipe as mp
-from ultralytics import YOLO
-from sklearn.cluster import DBSCAN
 from collections import deque
 import logging
 import uuid
+import json
+import threading
 
-# InsightFace (RetinaFace R50)
-from insightface.app import FaceAnalysis
+try:
+    from flask_sock import Sock
+except ImportError:  # optional dependency: /camera/stream is only served when installed
+    Sock = None
+
+from appearance import FeatureBank
+from assignment import get_backend
+from box_fusion import fuse_boxes
+from detector_strategy import STRATEGIES as DETECTOR_STRATEGIES, DetectorEngine
+from evidence_writer import EvidenceWriter
+from facemesh_pool import FaceMeshPool
+from frame_cache import FrameCache
+from frame_stream import LatestFrame
+from inference_backends import cap_insightface_threads, insightface_kwargs, load_yolo, set_torch_threads
+from head_pose import solve_head_pose, yaw_percent
+from micro_batcher import MicroBatcher
+from model_manager import ModelManager, ModelNotReady
+from session_registry import TrackerRegistry
+from stage_metrics import StageTimers, render_prometheus
+from tiling import TiledDetector
+from worker_pool import Overloaded, WorkerError, WorkerPool
 
 # ------------------------ Config ------------------------
 CONF_THRESH = 0.25       # YOLO conf (fallback)
@@ -27,13 +43,86 @@ EMA_ALPHA = 0.35
 MAX_DISAPPEARED = 40
 MAX_DISTANCE = 140
 CLUSTER_EPS = 100
+SESSION_TTL_SEC = float(os.environ.get("SESSION_TTL_SEC", 900))        # drop trackers idle this long
+MAX_TOTAL_TRACKS = int(os.environ.get("MAX_TOTAL_TRACKS", 5000))        # track budget across all sessions
+ASSIGNMENT_BACKEND = os.environ.get("ASSIGNMENT_BACKEND", "hungarian")  # greedy | hungarian
+FACEMESH_POOL_SIZE = int(os.environ.get("FACEMESH_POOL_SIZE", os.cpu_count() or 4))  # ~ one per worker thread
+MAX_DECODE_WIDTH = int(os.environ.get("MAX_DECODE_WIDTH", 1280))        # reduce-decode wider JPEGs when not tiling
+FRAME_CACHE_TTL_SEC = float(os.environ.get("FRAME_CACHE_TTL_SEC", 120))  # lean-mode frames fetchable this long
+EVIDENCE_DIR = "./cheating_images/"
+EVIDENCE_QUEUE_SIZE = int(os.environ.get("EVIDENCE_QUEUE_SIZE", 64))
+EVIDENCE_QUEUE_POLICY = os.environ.get("EVIDENCE_QUEUE_POLICY", "drop")  # drop | block (when queue is full)
+DETECTOR_STRATEGY = os.environ.get("DETECTOR_STRATEGY", "cascade")     # primary | cascade | concurrent
+CASCADE_MIN_CONF = float(os.environ.get("CASCADE_MIN_CONF", 0.6))       # weakest RetinaFace score that skips YOLO
+FUSION_METHOD = os.environ.get("FUSION_METHOD", "nms")                 # nms | wbf (weighted box fusion)
+TILE_SIZE = int(os.environ.get("TILE_SIZE", 1280))                      # detector input size; 0 = never tile
+TILE_OVERLAP = int(os.environ.get("TILE_OVERLAP", 256))                 # > largest face expected at the tile seams
+TILE_SLACK = float(os.environ.get("TILE_SLACK", 2.0))                   # tile only frames above TILE_SLACK x TILE_SIZE
+MIN_FACE_PX = 20         # smaller boxes skip FaceMesh (halved below 1280px wide, as with the old 2x upscale)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")     # torch | onnx | openvino (YOLO + InsightFace)
+INFERENCE_INT8 = os.environ.get("INFERENCE_INT8", "0") == "1"          # quantized YOLO export
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", 0)) or None # intra-op threads per model (None = runtime default)
+MODEL_LOAD_MODE = os.environ.get("MODEL_LOAD_MODE", "background")     # background | lazy | eager
+MODEL_WAIT_SEC = float(os.environ.get("MODEL_WAIT_SEC", 30))            # requests wait this long for loading models
+PRELOAD_MODELS = os.environ.get("PRELOAD_MODELS", "0") == "1"           # load fork-safe weights at import (pre-fork master)
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 8))               # frames / tiles per batched YOLO pass
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", 5))           # wait for company this long; 0 = no batching
+METRICS_WINDOW = int(os.environ.get("METRICS_WINDOW", 1024))           # recent samples per stage behind the percentiles
+SERVE_PORT = int(os.environ.get("PORT", 5001))
+SERVE_WORKERS = int(os.environ.get("SERVE_WORKERS", 0))                 # inference processes; 0 = in-process dev server
+# serve /camera/stream (needs flask-sock); off by default with workers, where it would replace waitress
+STREAM_ENABLED = os.environ.get("STREAM_ENABLED", "0" if SERVE_WORKERS > 0 else "1") == "1"
+SERVE_THREADS = int(os.environ.get("SERVE_THREADS", 32))                # HTTP front-end threads
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", 2))               # concurrent frames inside one worker
+WORKER_MAX_INFLIGHT = int(os.environ.get("WORKER_MAX_INFLIGHT", 4))     # beyond this a worker's requests get 503
+WORKER_TIMEOUT_SEC = float(os.environ.get("WORKER_TIMEOUT_SEC", 30))
+WORKER_START_METHOD = os.environ.get("WORKER_START_METHOD", "fork")     # fork shares preloaded weights; spawn is cleaner
+BINARY_MIMETYPES = ("image/jpeg", "image/png", "image/webp", "application/octet-stream")
 
 # ------------------------ Utilities ------------------------
-def decode_image(image_data):
+def jpeg_dimensions(buf):
+    """(width, height) from a JPEG's SOF header without decoding pixels; None if not a JPEG."""
+    if len(buf) < 4 or buf[0] != 0xFF or buf[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < len(buf):
+        if buf[i] != 0xFF:
+            i += 1
+            continue
+        marker = buf[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            i += 1 if marker == 0xFF else 2
+            continue
+        seg_len = (buf[i + 2] << 8) | buf[i + 3]
+        # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            h = (buf[i + 5] << 8) | buf[i + 6]
+            w = (buf[i + 7] << 8) | buf[i + 8]
+            return w, h
+        i += 2 + seg_len
+    return None
+
+def decode_image_bytes(buf, max_width=MAX_DECODE_WIDTH):
+    """Decode encoded image bytes straight to BGR, letting libjpeg downscale oversized frames."""
+    flag = cv2.IMREAD_COLOR
+    dims = jpeg_dimensions(buf) if max_width else None
+    if dims:
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if dims[0] // factor >= max_width:
+                flag = reduced
+                break
+    img = cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), flag)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return img
+
+def data_url_bytes(image_data):
     header, encoded = image_data.split(",", 1)
-    img = base64.b64decode(encoded)
-    img = Image.open(BytesIO(img)).convert("RGB")
-    return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    return base64.b64decode(encoded)
+
+def decode_image(image_data):
+    return decode_image_bytes(data_url_bytes(image_data))
 
 def encode_image(img):
     _, buffer = cv2.imencode(".jpg", img)
@@ -43,8 +132,19 @@ def bbox_center(b):
     x1, y1, x2, y2 = b
     return (int((x1 + x2) / 2), int((y1 + y2) / 2))
 
+def render_annotations(img, overlays):
+    """Draw boxes + flag text collected by the pipeline onto img (in place)."""
+    for o in overlays:
+        x1, y1, x2, y2 = o["box"]
+        color = o["color"]
+        cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
+        for i, f in enumerate(o["flags"]):
+            cv2.putText(img, f, (x1, y1 - 10 - (12 * i)), cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1)
+    return img
+
 # ------------------------ Clustering & merge ------------------------
 def cluster_faces(detections, threshold=75):
+    from sklearn.cluster import DBSCAN
     if len(detections) == 0:
         return {}
     centroids = np.array([[(x1 + x2) / 2, (y1 + y2) / 2] for (x1, y1, x2, y2) in detections])
@@ -55,103 +155,9 @@ def cluster_faces(detections, threshold=75):
         clustered.setdefault(label, []).append(detections[i])
     return clustered
 
-def merge_detections(retina, yolo, iou_thresh=0.35):
-    all_boxes = retina + yolo
-    merged = []
-    for box in all_boxes:
-        x1, y1, x2, y2 = box
-        area = max(0, x2 - x1) * max(0, y2 - y1)
-        overlap = False
-        for m in merged:
-            mx1, my1, mx2, my2 = m
-            inter_x1, inter_y1 = max(x1, mx1), max(y1, my1)
-            inter_x2, inter_y2 = min(x2, mx2), min(y2, my2)
-            iw = max(0, inter_x2 - inter_x1)
-            ih = max(0, inter_y2 - inter_y1)
-            inter_area = iw * ih
-            marea = max(0, mx2 - mx1) * max(0, my2 - my1)
-            union = area + marea - inter_area if (area + marea - inter_area) > 0 else 1
-            iou = inter_area / union
-            if iou > iou_thresh:
-                overlap = True
-                break
-        if not overlap:
-            merged.append(box)
-    return merged
-
-# ------------------------ Head pose helpers (same approach) ------------------------
-def is_face_forward(landmarks, img_width, img_height, head_yaw_threshold=HEAD_YAW_DEG):
-    model_points = np.array([
-        (0.0, 0.0, 0.0),
-        (0.0, -330.0, -65.0),
-        (-225.0, 170.0, -135.0),
-        (225.0, 170.0, -135.0),
-        (-150.0, -150.0, -125.0),
-        (150.0, -150.0, -125.0)
-    ], dtype="double")
-
-    image_points = np.array([
-        (landmarks[1].x * img_width, landmarks[1].y * img_height),
-        (landmarks[152].x * img_width, landmarks[152].y * img_height),
-        (landmarks[33].x * img_width, landmarks[33].y * img_height),
-        (landmarks[263].x * img_width, landmarks[263].y * img_height),
-        (landmarks[61].x * img_width, landmarks[61].y * img_height),
-        (landmarks[291].x * img_width, landmarks[291].y * img_height)
-    ], dtype="double")
-
-    focal_length = img_width
-    center = (img_width / 2, img_height / 2)
-    camera_matrix = np.array([[focal_length, 0, center[0]],
-                              [0, focal_length, center[1]],
-                              [0, 0, 1]], dtype="double")
-    dist_coeffs = np.zeros((4, 1))
-
-    try:
-        _, rvec, tvec = cv2.solvePnP(model_points, image_points, camera_matrix, dist_coeffs)
-        rotation_matrix, _ = cv2.Rodrigues(rvec)
-        euler_angles = cv2.decomposeProjectionMatrix(np.hstack((rotation_matrix, tvec)))[6]
-        yaw = euler_angles[1]
-        return abs(yaw) <= head_yaw_threshold
-    except Exception:
-        return False
-
-def estimate_head_yaw(landmarks, img_shape):
-    ih, iw = img_shape
-    model_points = np.array([
-        (0.0, 0.0, 0.0),
-        (0.0, -330.0, -65.0),
-        (-225.0, 170.0, -135.0),
-        (225.0, 170.0, -135.0),
-        (-150.0, -150.0, -125.0),
-        (150.0, -150.0, -125.0)
-    ], dtype="double")
-
-    image_points = np.array([
-        (landmarks[1].x * iw, landmarks[1].y * ih),
-        (landmarks[152].x * iw, landmarks[152].y * ih),
-        (landmarks[33].x * iw, landmarks[33].y * ih),
-        (landmarks[263].x * iw, landmarks[263].y * ih),
-        (landmarks[61].x * iw, landmarks[61].y * ih),
-        (landmarks[291].x * iw, landmarks[291].y * ih)
-    ], dtype="double")
-
-    focal_length = iw
-    center = (iw / 2, ih / 2)
-    camera_matrix = np.array([[focal_length, 0, center[0]],
-                              [0, focal_length, center[1]],
-                              [0, 0, 1]], dtype="double")
-    dist_coeffs = np.zeros((4, 1))
-
-    try:
-        _, rvec, tvec = cv2.solvePnP(model_points, image_points, camera_matrix, dist_coeffs)
-        rotation_matrix, _ = cv2.Rodrigues(rvec)
-        euler_angles = cv2.decomposeProjectionMatrix(np.hstack((rotation_matrix, tvec)))[6]
-        yaw = euler_angles[1]
-        max_yaw = 45.0
-        normalized = min(max(abs(yaw) / max_yaw, 0), 1) * 100.0
-        return float(normalized)
-    except Exception:
-        return 100.0
+def merge_detections(runs, iou_thresh=0.35, method=None):
+    """Fuse (boxes, scores) from every detector pass; returns (boxes, scores) with confidences kept."""
+    return fuse_boxes(runs, iou_thresh=iou_thresh, method=method or FUSION_METHOD)
 
 # ------------------------ Appearance features & tracker ------------------------
 def extract_hist_feature(img_roi, bins=(16, 16, 16)):
@@ -162,15 +168,6 @@ def extract_hist_feature(img_roi, bins=(16, 16, 16)):
     cv2.normalize(hist, hist)
     return hist.flatten()
 
-def hist_similarity(h1, h2):
-    if h1 is None or h2 is None:
-        return 0.0
-    try:
-        score = cv2.compareHist(h1.astype('float32'), h2.astype('float32'), cv2.HISTCMP_CORREL)
-        return float(max(0.0, (score + 1.0) / 2.0))
-    except Exception:
-        return 0.0
-
 class Track:
     def __init__(self, tid, bbox, feature, frame_idx):
         self.id = tid
@@ -184,6 +181,7 @@ class Track:
         self.ema_yaw = 0.0
         self.consec_suspicious = 0
         self.reach_count = 0
+        self.head_pose = None
 
     def update(self, bbox, feature, frame_idx):
         self.bbox = bbox
@@ -198,19 +196,23 @@ class Track:
         self.disappeared = 0
 
 class AppearanceTracker:
-    def __init__(self):
+    def __init__(self, assignment=ASSIGNMENT_BACKEND):
+        self.assign = get_backend(assignment)
         self.next_id = 1
         self.tracks = dict()
+        self.bank = FeatureBank()   # contiguous float32 copy of track features for batched similarity
 
     def register(self, bbox, feature, frame_idx):
         t = Track(self.next_id, bbox, feature, frame_idx)
         self.tracks[self.next_id] = t
+        self.bank.set(t.id, feature)
         self.next_id += 1
         return t
 
     def deregister(self, tid):
         if tid in self.tracks:
             del self.tracks[tid]
+            self.bank.remove(tid)
 
     def match_and_update(self, detections, features, frame_idx):
         det_count = len(detections)
@@ -225,140 +227,189 @@ class AppearanceTracker:
         det_centroids = np.array([bbox_center(b) for b in detections], dtype=float)
 
         if not self.tracks:
-            for bbox, feat in zip(detections, features):
-                self.register(bbox, feat, frame_idx)
-            mapping = {i: list(self.tracks.keys())[i] for i in range(len(detections))}
+            mapping = {}
+            for j, (bbox, feat) in enumerate(zip(detections, features)):
+                mapping[j] = self.register(bbox, feat, frame_idx).id
             return self.tracks, mapping
 
         track_ids = list(self.tracks.keys())
         track_centroids = np.array([self.tracks[tid].centroid_ema for tid in track_ids], dtype=float)
         D = np.linalg.norm(track_centroids[:, None, :] - det_centroids[None, :, :], axis=2)
-        A = np.zeros_like(D)
-        for i, tid in enumerate(track_ids):
-            tfeat = self.tracks[tid].feature
-            for j, feat in enumerate(features):
-                if tfeat is None or feat is None:
-                    A[i, j] = 0.0
-                else:
-                    A[i, j] = hist_similarity(tfeat, feat)
+        C, valid = self.bank.correlation(track_ids, features)
+        A = np.where(valid, np.maximum(0.0, (C + 1.0) / 2.0), 0.0)
 
         maxd = max(D.max(), 1.0)
         sim_dist = 1.0 - (D / maxd)
         score = 0.55 * A + 0.45 * sim_dist
 
-        assigned_tracks = set()
-        assigned_dets = set()
-        matches = []
-        for _ in range(min(score.shape[0], score.shape[1])):
-            i, j = divmod(score.argmax(), score.shape[1])
-            if score[i, j] <= 0.2:
-                break
-            if i in assigned_tracks or j in assigned_dets:
-                score[i, j] = -1
-                continue
-            if D[i, j] > MAX_DISTANCE:
-                score[i, j] = -1
-                continue
-            assigned_tracks.add(i)
-            assigned_dets.add(j)
-            matches.append((track_ids[i], j))
-            score[i, :] = -1
-            score[:, j] = -1
+        # det index -> track row, optimal under the MAX_DISTANCE gate
+        det_to_row = self.assign(score, D <= MAX_DISTANCE, min_score=0.2)
 
-        for tid, j in matches:
+        mapping = {}
+        for j, i in det_to_row.items():
+            tid = track_ids[i]
             self.tracks[tid].update(detections[j], features[j], frame_idx)
+            self.bank.set(tid, self.tracks[tid].feature)
+            mapping[j] = tid
 
-        matched_track_ids = {m[0] for m in matches}
-        for tid in track_ids:
-            if tid not in matched_track_ids:
-                t = self.tracks.get(tid)
-                if t:
-                    t.disappeared += 1
-                    if t.disappeared > MAX_DISAPPEARED:
-                        self.deregister(tid)
+        matched_rows = set(det_to_row.values())
+        for i, tid in enumerate(track_ids):
+            if i not in matched_rows:
+                t = self.tracks[tid]
+                t.disappeared += 1
+                if t.disappeared > MAX_DISAPPEARED:
+                    self.deregister(tid)
 
-        matched_dets = {m[1] for m in matches}
         for j, bbox in enumerate(detections):
-            if j not in matched_dets:
-                self.register(bbox, features[j], frame_idx)
-
-        mapping = {}
-        for tid in self.tracks:
-            try:
-                distances = [np.linalg.norm(np.array(bbox_center(self.tracks[tid].bbox)) - np.array(bbox_center(d))) for d in detections]
-                if len(distances) > 0:
-                    j = int(np.argmin(distances))
-                    mapping[j] = tid
-            except Exception:
-                pass
+            if j not in mapping:
+                mapping[j] = self.register(bbox, features[j], frame_idx).id
 
         return self.tracks, mapping
 
 # ------------------------ Load detection models ------------------------
-print("Loading models... (RetinaFace R50 via insightface)")
-# FaceAnalysis with detection module (will download weights if needed)
-# ctx_id=0 -> GPU, ctx_id=-1 -> CPU fallback
-INSIGHT_CTX_ID = 0  # change to -1 for CPU only
-fa = FaceAnalysis(allowed_modules=['detection'])
-try:
-    fa.prepare(ctx_id=INSIGHT_CTX_ID, det_size=(1280, 1280))
-    print("InsightFace prepared on ctx_id =", INSIGHT_CTX_ID)
-except Exception as e:
-    logging.warning(f"InsightFace GPU prepare failed ({e}), falling back to CPU.")
-    fa.prepare(ctx_id=-1, det_size=(1280, 1280))
-    print("InsightFace prepared on CPU")
-
-print("Loading YOLO fallback model (optional)")
-yolo_model = YOLO('yolov8m-face-lindevs.pt')  # keep your original fallback
-print("YOLO loaded")
-
-# ------------------------ Global tracker ------------------------
-tracker = AppearanceTracker()
-frame_index = 0
-mp_face_mesh = mp.solutions.face_mesh
+# nothing heavy happens at import: the model manager loads (and warms) the models
+# in the background, lazily or eagerly depending on MODEL_LOAD_MODE
+INSIGHT_CTX_ID = int(os.environ.get("INSIGHT_CTX_ID", -1))  # inference nodes are CPU-only; 0 for the first GPU
+if INFERENCE_BACKEND == "openvino":
+    INSIGHT_CTX_ID = max(INSIGHT_CTX_ID, 0)  # ctx_id < 0 would reset the OpenVINO provider to plain CPU
+
+def load_retinaface():
+    # InsightFace (RetinaFace R50); FaceAnalysis with detection module (will download weights if needed)
+    from insightface.app import FaceAnalysis
+    fa = FaceAnalysis(allowed_modules=['detection'], **insightface_kwargs(INFERENCE_BACKEND, INFERENCE_THREADS))
+    try:
+        fa.prepare(ctx_id=INSIGHT_CTX_ID, det_size=(1280, 1280))
+        print("InsightFace prepared on ctx_id =", INSIGHT_CTX_ID)
+    except Exception as e:
+        logging.warning(f"InsightFace GPU prepare failed ({e}), falling back to CPU.")
+        fa.prepare(ctx_id=-1, det_size=(1280, 1280))
+        print("InsightFace prepared on CPU")
+    # FaceAnalysis builds its ORT sessions with default options, so the thread cap is applied here
+    if INFERENCE_THREADS:
+        cap_insightface_threads(fa, INFERENCE_THREADS)
+    return fa
+
+# plain torch weights hold no runtime threads until the first inference, so they can be loaded before a fork
+YOLO_FORK_SAFE = INFERENCE_BACKEND == "torch"
+
+def load_yolo_fallback():
+    # batch: the micro-batcher sends up to BATCH_MAX_SIZE frames/tiles per predict, so exports need a dynamic batch axis
+    model = load_yolo('yolov8m-face-lindevs.pt', backend=INFERENCE_BACKEND, imgsz=1280,  # keep your original fallback
+                      int8=INFERENCE_INT8, threads=INFERENCE_THREADS, batch=BATCH_MAX_SIZE, warmup=not YOLO_FORK_SAFE)
+    print("YOLO loaded on", model.backend_name)
+    return model
+
+def load_face_mesh_pool():
+    import mediapipe as mp
+    # static_image_mode: every ROI is a different face, so cross-call landmark tracking would only hurt
+    return FaceMeshPool(
+        lambda: mp.solutions.face_mesh.FaceMesh(static_image_mode=True, min_detection_confidence=0.3),
+        size=FACEMESH_POOL_SIZE,
+    )
+
+WARMUP_FRAME = np.zeros((720, 1280, 3), dtype=np.uint8)
+
+models = ModelManager(mode=MODEL_LOAD_MODE)
+models.register("retinaface", load_retinaface, warmup=lambda fa: fa.get(WARMUP_FRAME))
+models.register("yolo", load_yolo_fallback, fork_safe=YOLO_FORK_SAFE,
+                warmup=lambda m: m.predict(WARMUP_FRAME, imgsz=1280, conf=CONF_THRESH, verbose=False))
+models.register("facemesh", load_face_mesh_pool,
+                warmup=lambda pool: print("FaceMesh pool ready with", pool.warm(), "instances"))
+if PRELOAD_MODELS:
+    models.preload()
+
+# ------------------------ Per-session trackers ------------------------
+# frames posted without a session/camera id share the "default" tracker
+DEFAULT_SESSION = "default"
+sessions = TrackerRegistry(AppearanceTracker, ttl_seconds=SESSION_TTL_SEC, max_total_tracks=MAX_TOTAL_TRACKS)
+
+# ------------------------ Stage timers ------------------------
+# one set per process; inference workers report theirs to the front end's /metrics
+timers = StageTimers(window=METRICS_WINDOW)
+
+# ------------------------ Evidence writer ------------------------
+evidence_writer = EvidenceWriter(EVIDENCE_DIR, max_queue=EVIDENCE_QUEUE_SIZE, policy=EVIDENCE_QUEUE_POLICY,
+                                 timers=timers)
 
 # ------------------------ Detection wrappers ------------------------
 def detect_faces_insight(img):
-    boxes = []
+    boxes, scores = [], []
     try:
-        faces = fa.get(img)  # returns list of Face objects
+        model = models.get("retinaface")
+        with timers.time("detect_retinaface"):
+            faces = model.get(img)  # returns list of Face objects
         for f in faces:
             x1, y1, x2, y2 = f.bbox.astype(int)
             boxes.append((int(x1), int(y1), int(x2), int(y2)))
+            scores.append(float(f.det_score))
     except Exception as e:
         logging.warning(f"InsightFace detection error: {e}")
-    return boxes
+    return boxes, scores
+
+def predict_yolo_batch(imgs):
+    """One YOLO pass over frames/tiles from concurrent requests -> [(boxes, scores), ...] per image."""
+    results = models.get("yolo").predict(imgs, imgsz=1280, conf=CONF_THRESH, verbose=False)
+    out = []
+    for res in results:
+        boxes, scores = [], []
+        for box in res.boxes:
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            boxes.append((x1, y1, x2, y2))
+            scores.append(float(box.conf[0]))
+        out.append((boxes, scores))
+    return out
+
+# concurrent requests share batched YOLO passes (RetinaFace's insightface API is per-image, so it is not batched)
+yolo_batcher = MicroBatcher(predict_yolo_batch, max_batch=BATCH_MAX_SIZE, window_ms=BATCH_WINDOW_MS, name="yolo")
 
 def detect_faces_yolo(img):
-    boxes = []
     try:
-        results = yolo_model.predict(img, imgsz=1280, conf=CONF_THRESH, verbose=False)
-        for box in results[0].boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            boxes.append((x1, y1, x2, y2))
+        with timers.time("detect_yolo"):     # includes the wait for a batch slot
+            return yolo_batcher.submit(img)
+    except Exception as e:
+        logging.warning(f"YOLO detection error: {e}")
+        return [], []
+
+def detect_faces_yolo_many(imgs):
+    """All tiles of one frame queued together, so they share a batched pass."""
+    try:
+        with timers.time("detect_yolo"):
+            return yolo_batcher.submit_many(imgs)
     except Exception as e:
         logging.warning(f"YOLO detection error: {e}")
-    return boxes
+        return [([], []) for _ in imgs]
+
+# RetinaFace is the primary detector, YOLO the fallback; both see the frame at native scale (tiled if large)
+# "concurrent" runs one fallback per in-flight frame, so its pool matches this process's request threads
+detector_engine = DetectorEngine(("retinaface", TiledDetector(detect_faces_insight, TILE_SIZE, TILE_OVERLAP, TILE_SLACK)),
+                                 ("yolo", TiledDetector(detect_faces_yolo, TILE_SIZE, TILE_OVERLAP, TILE_SLACK,
+                                                        detect_many=detect_faces_yolo_many)),
+                                 strategy=DETECTOR_STRATEGY, min_conf=CASCADE_MIN_CONF,
+                                 max_workers=WORKER_THREADS if SERVE_WORKERS > 0 else SERVE_THREADS)
 
 # ------------------------ Main pipeline ------------------------
-def detect_faces_and_gaze(img):
-    global frame_index, tracker
-    frame_index += 1
+def detect_faces_and_gaze(img, session, strategy=None):
+    session.frame_index += 1
+    frame_index = session.frame_index
+    tracker = session.tracker
 
     students = []
+    overlays = []       # drawn lazily: only for evidence, full responses or fetched frames
     suspicious = False
     red_box_drawn = False
 
-    ih, iw, _ = img.shape
-    if iw < 1280:
-        img = cv2.resize(img, (iw*2, ih*2))
-        ih, iw, _ = img.shape
+    # everything below works in source-image coordinates
+    iw = img.shape[1]
+    min_face = MIN_FACE_PX // 2 if iw < 1280 else MIN_FACE_PX
 
-    retina_boxes = detect_faces_insight(img)
-    yolo_boxes = detect_faces_yolo(img)
-    merged_boxes = merge_detections(retina_boxes, yolo_boxes, iou_thresh=0.35)
+    # faces seen on the previous frame; the cascade calls YOLO when RetinaFace finds fewer
+    live_tracks = sum(1 for t in tracker.tracks.values() if t.disappeared == 0)
+    runs = detector_engine.detect(img, strategy, expected=live_tracks)
+    with timers.time("merge"):
+        merged_boxes, merged_scores = merge_detections([(boxes, scores) for _, boxes, scores in runs], iou_thresh=0.35)
 
     # compute features for tracking
+    t_features = time.perf_counter()
     features = []
     for (x1, y1, x2, y2) in merged_boxes:
         x1c, y1c = max(0, x1), max(0, y1)
@@ -368,35 +419,49 @@ def detect_faces_and_gaze(img):
             continue
         roi = img[y1c:y2c, x1c:x2c]
         features.append(extract_hist_feature(roi))
+    timers.record("features", time.perf_counter() - t_features)
 
-    tracks, det_to_track = tracker.match_and_update(merged_boxes, features, frame_index)
+    with timers.time("tracking"):
+        tracks, det_to_track = tracker.match_and_update(merged_boxes, features, frame_index)
 
-    with mp_face_mesh.FaceMesh(min_detection_confidence=0.3, min_tracking_confidence=0.3) as face_mesh:
+    # FaceMesh and pose run once per face; their time is summed and recorded once per frame
+    mesh_time = pose_time = 0.0
+    with models.get("facemesh").checkout() as face_mesh:
         for det_idx, bbox in enumerate(merged_boxes):
             x1, y1, x2, y2 = map(int, bbox)
-            if (x2 - x1) < 20 or (y2 - y1) < 20:
+            if (x2 - x1) < min_face or (y2 - y1) < min_face:
                 continue
             face_roi = img[y1:y2, x1:x2]
+            t0 = time.perf_counter()
             face_rgb = cv2.cvtColor(face_roi, cv2.COLOR_BGR2RGB)
             mesh_results = face_mesh.process(face_rgb)
+            mesh_time += time.perf_counter() - t0
 
             flags = []
             color = (0, 255, 0)
             yaw_pct_local = 0.0
 
+            track_id = det_to_track.get(det_idx, None)
+            t = tracks.get(track_id) if track_id is not None else None
+
             if mesh_results.multi_face_landmarks:
                 for landmarks in mesh_results.multi_face_landmarks:
-                    yaw_pct_local = estimate_head_yaw(landmarks.landmark, (img.shape[0], img.shape[1]))
+                    # one solve per face, warm-started from this person's last pose
+                    t0 = time.perf_counter()
+                    pose = solve_head_pose(landmarks.landmark, (img.shape[0], img.shape[1]),
+                                           guess=t.head_pose if t is not None else None)
+                    pose_time += time.perf_counter() - t0
+                    yaw_pct_local = yaw_percent(pose.yaw) if pose is not None else 100.0
                     if yaw_pct_local > 30:
                         flags.append(f"Yaw {yaw_pct_local:.1f}% (Suspicious)")
                         color = (0, 0, 255)
-                    if not is_face_forward(landmarks.landmark, img.shape[1], img.shape[0]):
+                    if pose is None or abs(pose.yaw) > HEAD_YAW_DEG:
                         flags.append("Face turned sideways")
                         color = (0, 0, 255)
+                    if t is not None:
+                        t.head_pose = pose
 
-            track_id = det_to_track.get(det_idx, None)
-            if track_id is not None and track_id in tracks:
-                t = tracks[track_id]
+            if t is not None:
                 if len(flags) > 0:
                     inc = yaw_pct_local if yaw_pct_local > 0 else 10.0
                     t.suspicion = t.suspicion * SUSPICION_DECAY + inc
@@ -415,8 +480,10 @@ def detect_faces_and_gaze(img):
 
                 students.append({
                     "id": int(t.id),
+                    "box": [x1, y1, x2, y2],
                     "cheating": bool(is_cheating),
                     "suspicionScore": float(t.suspicion),
+                    "detectionScore": round(merged_scores[det_idx], 4),
                     "flags": flags
                 })
             else:
@@ -426,59 +493,398 @@ def detect_faces_and_gaze(img):
                     red_box_drawn = True
                 students.append({
                     "id": None,
+                    "box": [x1, y1, x2, y2],
                     "cheating": is_cheating,
                     "suspicionScore": 0.0,
+                    "detectionScore": round(merged_scores[det_idx], 4),
                     "flags": flags
                 })
 
-            cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
-            for i, f in enumerate(flags):
-                cv2.putText(img, f, (x1, y1 - 10 - (12 * i)), cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1)
+            overlays.append({"box": (x1, y1, x2, y2), "color": color, "flags": list(flags)})
 
         if len(merged_boxes) > 1:
             suspicious = True
             for s in students:
                 s.setdefault("flags", []).append("Multiple faces detected")
                 s["cheating"] = True
+    timers.record("facemesh", mesh_time)
+    timers.record("pose", pose_time)
 
+    saved_path = None
     if red_box_drawn:
-        os.makedirs('./cheating_images/', exist_ok=True)
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        cv2.imwrite(f'./cheating_images/cheating_{timestamp}.jpg', img)
+        # encoding + disk write happen on the evidence writer thread
+        with timers.time("annotate"):
+            evidence = render_annotations(img.copy(), overlays)
+        saved_path = evidence_writer.submit(evidence)
 
-    return students, suspicious, img
+    return students, suspicious, img, overlays, saved_path
 
 # ------------------------ Flask App ------------------------
 app = Flask(__name__)
 CORS(app)
+frame_cache = FrameCache(ttl_seconds=FRAME_CACHE_TTL_SEC)
+
+def read_upload():
+    """
+    Accepts three encodings of the same request:
+    - multipart/form-data with an `image` file part (+ optional sessionId/cameraId fields)
+    - a raw image/jpeg (or png/webp/octet-stream) body, ids in the query string or X-Session-Id
+    - the original JSON body with a base64 data URL in `image`
+    returns (encoded_bytes, params); decoding happens where the frame is processed
+    """
+    if "image" in request.files:
+        return request.files["image"].read(), request.form.to_dict()
+    if request.mimetype in BINARY_MIMETYPES:
+        params = request.args.to_dict()
+        if request.headers.get("X-Session-Id"):
+            params.setdefault("sessionId", request.headers["X-Session-Id"])
+        return request.get_data(), params
+    data = request.get_json()
+    params = {k: v for k, v in data.items() if k != "image"}
+    return data_url_bytes(data.get("image")), params
+
+def session_key_for(params):
+    client_session = params.get("sessionId") or params.get("cameraId")
+    return str(client_session) if client_session else DEFAULT_SESSION
+
+def handle_frame(buf, params):
+    """
+    Full per-frame work for one upload (runs in-process or inside an inference worker).
+    returns (response dict, overlays, frame shape); lean responses carry no image
+    """
+    lean = params.get("response", "full") == "lean"
+    client_session = params.get("sessionId") or params.get("cameraId")
+    session_id = str(client_session) if client_session else str(uuid.uuid4())
+    strategy = params.get("detectorStrategy") or None
+
+    # 503 instead of a long hang while models are still loading after a (re)start
+    for name in ("retinaface", "yolo", "facemesh"):
+        models.get(name, timeout=MODEL_WAIT_SEC)
+
+    t_frame = time.perf_counter()
+    with timers.time("decode"):
+        # tiling needs the native resolution; without it libjpeg downscales oversized frames while decoding
+        img = decode_image_bytes(buf, max_width=0 if TILE_SIZE else MAX_DECODE_WIDTH)
+    dims = jpeg_dimensions(buf)
+    scale = dims[0] / img.shape[1] if dims else 1.0
+    with sessions.session(session_key_for(params)) as session:
+        students, suspicious, frame, overlays, saved_path = detect_faces_and_gaze(img, session, strategy)
+    timers.incr("frames_total")
+    timers.incr("faces_detected_total", len(students))
+    if suspicious:
+        timers.incr("suspicious_frames_total")
+
+    response = {
+        "sessionId": session_id,
+        "facesDetected": len(students),
+        "students": students,
+        # boxes, overlays and the returned image share the processed frame's coordinates;
+        # multiply by sourceScale for the uploaded image's (it differs when libjpeg downscaled the decode)
+        "frameSize": [int(frame.shape[1]), int(frame.shape[0])],
+        "sourceScale": round(scale, 6),
+        "message": "🚨 Cheating detected" if suspicious else "✅ Normal"
+    }
+    if not lean:
+        with timers.time("annotate"):
+            annotated = render_annotations(frame, overlays)
+        with timers.time("encode"):
+            response["image"] = encode_image(annotated)
+    if saved_path:
+        response["savedImagePath"] = saved_path
+    timers.record("frame", time.perf_counter() - t_frame)
+    return response, overlays, frame.shape[:2]
+
+def local_stats():
+    return {
+        "pid": os.getpid(),
+        "faceMeshPool": models.peek("facemesh").stats() if models.peek("facemesh") else None,
+        "sessions": sessions.stats(),
+        "evidenceWriter": evidence_writer.stats(),
+        "detectors": detector_engine.stats(),
+        "yoloBatcher": yolo_batcher.stats(),
+        "models": models.status(),
+        "stages": timers.summary(),
+    }
+
+# ------------------------ Inference workers ------------------------
+def local_metrics():
+    """This process's stage timers plus gauges sampled now (sent to the front end by workers)."""
+    sess = sessions.stats()
+    ev = evidence_writer.stats()
+    return {
+        "timers": timers.snapshot(),
+        "gauges": [
+            ("models_ready", {}, int(models.ready)),
+            ("sessions_active", {}, sess["sessions"]),
+            ("tracks_active", {}, sess["totalTracks"]),
+            ("evidence_queue_depth", {}, ev["queueDepth"]),
+        ],
+    }
+
+def init_worker(index):
+    """Per-process set-up inside an inference worker: split the cores, then load models."""
+    global INFERENCE_THREADS, FACEMESH_POOL_SIZE
+    INFERENCE_THREADS = INFERENCE_THREADS or max(1, (os.cpu_count() or 1) // max(1, SERVE_WORKERS))
+    FACEMESH_POOL_SIZE = WORKER_THREADS
+    os.environ["OMP_NUM_THREADS"] = str(INFERENCE_THREADS)
+    cv2.setNumThreads(INFERENCE_THREADS)
+    set_torch_threads(INFERENCE_THREADS)
+    print(f"Inference worker {index} (pid {os.getpid()}): {INFERENCE_THREADS} inference threads")
+    models.start()
+
+def worker_handler(kind, payload):
+    if kind == "frame":
+        return handle_frame(*payload)
+    if kind == "stats":
+        return local_stats()
+    if kind == "ready":
+        return models.status()
+    if kind == "metrics":
+        return local_metrics()
+    raise ValueError(f"Unknown worker call: {kind}")
+
+worker_pool = None      # set by serve() when SERVE_WORKERS > 0
+
+def process_frame(buf, params):
+    """Run one frame through the pipeline (a sticky worker or this process) and build its response."""
+    if worker_pool is not None:
+        # sticky: a session is always processed by the same worker, where its tracker lives
+        response, overlays, shape = worker_pool.submit(session_key_for(params), "frame", (buf, params))
+    else:
+        response, overlays, shape = handle_frame(buf, params)
+
+    # "full" (default) embeds the annotated frame; "lean" returns structured results only
+    if params.get("response", "full") == "lean":
+        frame_id = frame_cache.put(buf, shape, overlays)
+        response["frameId"] = frame_id
+        response["imageUrl"] = f"/camera/frames/{frame_id}"
+    return response
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def count_request(response):
+    if request.endpoint in ("upload", "annotated_frame"):
+        timers.incr("http_requests_total", endpoint=request.endpoint, status=response.status_code)
+        if request.endpoint == "upload":
+            timers.record("request", time.perf_counter() - g.request_start)
+    return response
 
 @app.route("/camera/upload", methods=["POST"])
 def upload():
     try:
-        data = request.get_json()
-        image_data = data.get("image")
-        img = decode_image(image_data)
-        session_id = str(uuid.uuid4())
-
-        students, suspicious, annotated_img = detect_faces_and_gaze(img)
-        annotated_img_base64 = encode_image(annotated_img)
-
-        response = {
-            "sessionId": session_id,
-            "facesDetected": len(students),
-            "students": students,
-            "image": annotated_img_base64,
-            "message": "🚨 Cheating detected" if suspicious else "✅ Normal"
-        }
-        if suspicious:
-            response["savedImagePath"] = f"./cheating_images/cheating_{time.strftime('%Y%m%d_%H%M%S')}.jpg"
-
-        return jsonify(response)
+        buf, params = read_upload()
+        strategy = params.get("detectorStrategy") or None
+        if strategy is not None and strategy not in DETECTOR_STRATEGIES:
+            return jsonify({"error": f"Unknown detectorStrategy: {strategy}"}), 400
+
+        return jsonify(process_frame(buf, params))
+    except Overloaded:
+        return jsonify({"error": "Server busy, retry shortly"}), 503, {"Retry-After": "1"}
+    except ModelNotReady as e:
+        return jsonify({"error": str(e)}), 503
+    except WorkerError as e:
+        if e.kind == "ModelNotReady":
+            return jsonify({"error": str(e)}), 503
+        return jsonify({"error": "Internal Server Error"}), 500
+    except TimeoutError:
+        return jsonify({"error": "Inference timed out"}), 504
     except Exception as e:
         logging.exception("Error in upload")
         return jsonify({"error": "Internal Server Error"}), 500
 
+# ------------------------ Streaming ingestion ------------------------
+active_streams = set()
+streams_lock = threading.Lock()
+
+def stream_frames(ws, params):
+    """
+    One persistent connection per camera/session: binary JPEG frames in, one JSON result per
+    processed frame out. Frames that arrive while inference is busy replace the waiting one
+    (dropped, never queued), so results always describe the newest frame.
+    """
+    slot = LatestFrame()
+    with streams_lock:
+        active_streams.add(slot)
+
+    def send(msg):
+        try:
+            ws.send(json.dumps(msg))
+        except Exception:
+            slot.close()        # client went away
+
+    def process():
+        while True:
+            item = slot.get()
+            if item is None:
+                return
+            seq, received_at, buf = item
+            queued_ms = (time.monotonic() - received_at) * 1000.0
+            timers.record("stream_wait", queued_ms / 1000.0)
+            try:
+                msg = process_frame(buf, params)
+                msg["type"] = "result"
+            except Overloaded:
+                msg = {"type": "busy"}
+            except (ModelNotReady, WorkerError, TimeoutError) as e:
+                msg = {"type": "error", "error": str(e)}
+            except Exception:
+                logging.exception("Error in stream frame")
+                msg = {"type": "error", "error": "Internal Server Error"}
+            msg.update({"frame": seq, "queuedMs": round(queued_ms, 1), "dropped": slot.dropped,
+                        "latencyMs": round((time.monotonic() - received_at) * 1000.0, 1)})
+            timers.incr("stream_results_total", type=msg["type"])
+            send(msg)
+
+    worker = threading.Thread(target=process, name="stream", daemon=True)
+    worker.start()
+    try:
+        while True:
+            data = ws.receive()
+            if data is None:
+                break
+            if isinstance(data, str):
+                continue        # text messages (e.g. keep-alives) carry no frame
+            dropped = slot.dropped      # only put() changes it, and only this thread puts
+            slot.put(data)
+            timers.incr("stream_frames_total")
+            if slot.dropped != dropped:
+                timers.incr("stream_frames_dropped_total")
+    finally:
+        slot.close()
+        worker.join(timeout=WORKER_TIMEOUT_SEC)
+        with streams_lock:
+            active_streams.discard(slot)
+
+if Sock is not None and STREAM_ENABLED:
+    sock = Sock(app)
+
+    @sock.route("/camera/stream")
+    def camera_stream(ws):
+        params = request.args.to_dict()
+        params.setdefault("response", "lean")   # the stream sends structured results; frames via /camera/frames
+        strategy = params.get("detectorStrategy") or None
+        if strategy is not None and strategy not in DETECTOR_STRATEGIES:
+            ws.send(json.dumps({"type": "error", "error": f"Unknown detectorStrategy: {strategy}"}))
+            return
+        stream_frames(ws, params)
+
+def stream_stats():
+    with streams_lock:
+        per = [s.stats() for s in active_streams]
+    return {"enabled": Sock is not None and STREAM_ENABLED, "active": len(per),
+            "received": sum(p["received"] for p in per), "dropped": sum(p["dropped"] for p in per)}
+
+@app.route("/camera/frames/<frame_id>", methods=["GET"])
+def annotated_frame(frame_id):
+    entry = frame_cache.get(frame_id)
+    if entry is None:
+        return jsonify({"error": "Frame not found or expired"}), 404
+    with timers.time("decode"):
+        img = decode_image_bytes(entry.source_bytes)
+    h, w = entry.shape
+    if img.shape[:2] != (h, w):
+        with timers.time("resize"):
+            img = cv2.resize(img, (w, h))
+    with timers.time("annotate"):
+        img = render_annotations(img, entry.overlays)
+    with timers.time("encode"):
+        _, jpg = cv2.imencode(".jpg", img)
+    return Response(jpg.tobytes(), mimetype="image/jpeg")
+
+@app.route("/camera/stats", methods=["GET"])
+def stats():
+    if worker_pool is not None:
+        return jsonify({
+            "frameCache": frame_cache.stats(),
+            "streams": stream_stats(),
+            "workerPool": worker_pool.stats(),
+            "workers": worker_pool.call_all("stats"),
+        })
+    out = local_stats()
+    out["frameCache"] = frame_cache.stats()
+    out["streams"] = stream_stats()
+    return jsonify(out)
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus text format: per-stage latency summaries, counters and gauges of every process."""
+    front = local_metrics() if worker_pool is None else {"timers": timers.snapshot(), "gauges": []}
+    snapshots = [({}, front["timers"])]
+    gauges = list(front["gauges"])
+    if worker_pool is not None:
+        snapshots = [({"worker": "frontend"}, front["timers"])]
+        # the probe is answered outside the frame queue (worker_pool.call_all); "up" is process liveness,
+        # so a busy worker whose reply is late is reported as up, just without fresh timers
+        replies = worker_pool.call_all("metrics", timeout=2.0)
+        for w in worker_pool.stats()["perWorker"]:
+            i = w["index"]
+            gauges.append(("worker_up", {"worker": i}, int(w["alive"])))
+            gauges.append(("worker_inflight", {"worker": i}, w["inflight"]))
+            gauges.append(("worker_metrics_ok", {"worker": i}, int(replies[i] is not None)))
+            if replies[i] is None:
+                continue
+            snapshots.append(({"worker": i}, replies[i]["timers"]))
+            gauges.extend((name, dict(labels, worker=i), value) for name, labels, value in replies[i]["gauges"])
+    gauges.append(("frame_cache_frames", {}, frame_cache.stats()["frames"]))
+    gauges.append(("streams_active", {}, stream_stats()["active"]))
+    return Response(render_prometheus(snapshots, gauges=gauges), mimetype="text/plain; version=0.0.4")
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up and serving (models may still be loading)."""
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: every model is loaded and warmed (in every worker)."""
+    if worker_pool is not None:
+        workers = worker_pool.call_all("ready", timeout=2.0)
+        ready = all(w is not None and w["ready"] for w in workers)
+        return jsonify({"ready": ready, "workers": workers}), (200 if ready else 503)
+    models.start()
+    status = models.status()
+    return jsonify(status), (200 if status["ready"] else 503)
+
+def serve():
+    """
+    SERVE_WORKERS = 0: models in this process behind Flask's threaded server (development).
+    SERVE_WORKERS > 0: this process is only the HTTP front end (waitress when installed); frames
+    go to a pool of inference worker processes, sticky per session, with load shedding.
+    """
+    global worker_pool
+    os.makedirs(EVIDENCE_DIR, exist_ok=True)
+    if SERVE_WORKERS <= 0:
+        models.start()
+        print(f"Starting server on port {SERVE_PORT}...")
+        app.run(host="0.0.0.0", port=SERVE_PORT, threaded=True)
+        return
+
+    # fork-safe weights are loaded once here and shared copy-on-write by the workers
+    if WORKER_START_METHOD == "fork":
+        models.preload()
+    worker_pool = WorkerPool(worker_handler, workers=SERVE_WORKERS, threads=WORKER_THREADS,
+                             max_inflight=WORKER_MAX_INFLIGHT, init=init_worker, timeout=WORKER_TIMEOUT_SEC,
+                             start_method=WORKER_START_METHOD)
+    worker_pool.start()
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:  # optional dependency
+        waitress_serve = None
+    if Sock is not None and STREAM_ENABLED and waitress_serve is not None:
+        # waitress cannot upgrade to WebSocket; only an explicit STREAM_ENABLED=1 gets here
+        logging.warning("STREAM_ENABLED=1: serving with Flask's threaded server instead of waitress")
+        waitress_serve = None
+    print(f"Starting front end on port {SERVE_PORT} with {SERVE_WORKERS} inference workers...")
+    try:
+        if waitress_serve is not None:
+            waitress_serve(app, host="0.0.0.0", port=SERVE_PORT, threads=SERVE_THREADS)
+        else:
+            app.run(host="0.0.0.0", port=SERVE_PORT, threaded=True)
+    finally:
+        worker_pool.close()
+
 if __name__ == "__main__":
-    os.makedirs('./cheating_images/', exist_ok=True)
-    print("Starting server on port 5001...")
-    app.run(host="0.0.0.0", port=5001)
+    serve()
@@ -0,0 +1,112 @@
+# appearance.py
+"""
+Batched appearance similarity for the trackers.
+
+cv2.compareHist(..., HISTCMP_CORREL) is the Pearson correlation of two
+histograms. If every row is centred and scaled to unit length once, the whole
+track x detection correlation matrix becomes a single float32 matrix product.
+Track rows are kept in a contiguous slab and refreshed only when a track's
+feature changes.
+"""
+
+import numpy as np
+
+
+def _centre_rows(M):
+    """Centre + L2-normalise rows in place; returns mask of rows with zero variance."""
+    M -= M.mean(axis=1, keepdims=True)
+    norms = np.sqrt(np.einsum("ij,ij->i", M, M, dtype=np.float64))
+    flat = norms <= np.finfo(np.float64).eps
+    norms[flat] = 1.0
+    M /= norms[:, None].astype(np.float32)
+    return flat
+
+
+def prepare_features(features, dim=None):
+    """
+    features: list of 1-D histograms (or None)
+    returns (M, valid, flat): float32 [N, dim] centred/normalised rows, mask of usable rows,
+    mask of constant rows (compareHist reports 1.0 for those)
+    """
+    n = len(features)
+    if dim is None:
+        dim = next((f.size for f in features if f is not None), 0)
+    M = np.zeros((n, dim), dtype=np.float32)
+    valid = np.zeros(n, dtype=bool)
+    for j, f in enumerate(features):
+        if f is not None and f.size == dim:
+            M[j] = f.ravel()
+            valid[j] = True
+    flat = _centre_rows(M) & valid
+    return M, valid, flat
+
+
+class FeatureBank:
+    """Contiguous float32 store of per-track normalised appearance features."""
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.dim = None
+        self.data = None
+        self.flat = None
+        self.slots = {}            # key -> row index
+        self._free = []
+
+    def _ensure(self, dim):
+        if self.data is None:
+            self.dim = dim
+            self.data = np.zeros((self.capacity, dim), dtype=np.float32)
+            self.flat = np.zeros(self.capacity, dtype=bool)
+            self._free = list(range(self.capacity - 1, -1, -1))
+        elif not self._free:
+            old = self.capacity
+            self.capacity *= 2
+            data = np.zeros((self.capacity, self.dim), dtype=np.float32)
+            data[:old] = self.data
+            flat = np.zeros(self.capacity, dtype=bool)
+            flat[:old] = self.flat
+            self.data, self.flat = data, flat
+            self._free = list(range(self.capacity - 1, old - 1, -1))
+
+    def set(self, key, feature):
+        if feature is None:
+            self.remove(key)
+            return
+        self._ensure(feature.size)
+        if feature.size != self.dim:
+            self.remove(key)
+            return
+        row = self.slots.get(key)
+        if row is None:
+            row = self._free.pop()
+            self.slots[key] = row
+        r = self.data[row:row + 1]
+        r[0] = feature.ravel()
+        self.flat[row] = _centre_rows(r)[0]
+
+    def remove(self, key):
+        row = self.slots.pop(key, None)
+        if row is not None:
+            self._free.append(row)
+
+    def correlation(self, keys, features):
+        """
+        Correlation of every key's stored feature against every detection feature.
+        returns (C, valid): C[i, j] matches cv2.compareHist(..., HISTCMP_CORREL),
+        valid[i, j] is False where either side has no feature
+        """
+        T, N = len(keys), len(features)
+        if self.data is None or T == 0 or N == 0:
+            return np.zeros((T, N), dtype=np.float32), np.zeros((T, N), dtype=bool)
+
+        rows = np.array([self.slots.get(k, -1) for k in keys], dtype=np.int64)
+        track_valid = rows >= 0
+        rows[~track_valid] = 0
+        dets, det_valid, det_flat = prepare_features(features, self.dim)
+
+        C = self.data[rows] @ dets.T
+        # compareHist returns 1.0 when either histogram has zero variance
+        C[self.flat[rows] & track_valid, :] = 1.0
+        C[:, det_flat] = 1.0
+        valid = track_valid[:, None] & det_valid[None, :]
+        return C, valid
@@ -0,0 +1,127 @@
+# assignment.py
+"""
+Gated track <-> detection assignment backends.
+
+All backends take a track x detection `score` matrix (higher is better) and a
+boolean `gate` of admissible pairs (e.g. centroid distance <= MAX_DISTANCE),
+and return a dict {det_idx: track_idx}.
+
+- "greedy":    highest score first over the gated pairs (one sort); a fast
+               approximation, not guaranteed to maximise the total score
+- "hungarian": optimal assignment via scipy's linear_sum_assignment, solved
+               independently on each connected component of the gated graph;
+               it maximises the total score of the matched pairs, where any
+               track or detection may stay unmatched (as in SORT)
+
+Without scipy, "hungarian" falls back to greedy.
+"""
+
+import logging
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # optional dependency
+    linear_sum_assignment = None
+
+
+def _candidates(score, gate, min_score):
+    ok = gate & (score > min_score)
+    rows, cols = np.nonzero(ok)
+    return ok, rows, cols
+
+
+def _components(rows, cols, n_rows):
+    """Connected components of the bipartite graph given by (rows, cols) edges."""
+    parent = {}
+
+    def find(x):
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while parent.get(x, x) != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for r, c in zip(rows.tolist(), cols.tolist()):
+        a, b = find(r), find(n_rows + c)
+        if a != b:
+            parent[a] = b
+
+    groups = {}
+    for r, c in zip(rows.tolist(), cols.tolist()):
+        g = groups.setdefault(find(r), (set(), set()))
+        g[0].add(r)
+        g[1].add(c)
+    return [(sorted(rs), sorted(cs)) for rs, cs in groups.values()]
+
+
+# ------------------------ Backends ------------------------
+def assign_greedy(score, gate, min_score=0.2):
+    _, rows, cols = _candidates(score, gate, min_score)
+    # stable sort on the row-major flattened order reproduces argmax tie-breaking
+    order = np.argsort(-score[rows, cols], kind="stable")
+    used_rows, mapping = set(), {}
+    for k in order.tolist():
+        i, j = int(rows[k]), int(cols[k])
+        if i in used_rows or j in mapping:
+            continue
+        used_rows.add(i)
+        mapping[j] = i
+    return mapping
+
+
+def _solve_dense(sub_score, sub_ok, solver):
+    """Run `solver` on one component; returns list of (row, col) local indices."""
+    if sub_score.shape == (1, 1):
+        return [(0, 0)] if sub_ok[0, 0] else []
+    return [(i, j) for i, j in solver(sub_score, sub_ok) if sub_ok[i, j]]
+
+
+def _hungarian(sub_score, sub_ok):
+    # Padded square problem: track i may take its private "unmatched" slot C + i at cost 0,
+    # so the solver maximises total score rather than match count.
+    R, C = sub_score.shape
+    n = R + C
+    big = 1e6   # infeasible; never cheaper than an unmatched slot
+    cost = np.full((n, n), big)
+    cost[:R, :C] = np.where(sub_ok, -sub_score, big)
+    cost[np.arange(R), C + np.arange(R)] = 0.0
+    cost[R + np.arange(C), np.arange(C)] = 0.0
+    cost[R:, C:] = 0.0
+    r, c = linear_sum_assignment(cost)
+    return [(i, j) for i, j in zip(r.tolist(), c.tolist()) if i < R and j < C]
+
+
+def _component_backend(solver):
+    def run(score, gate, min_score=0.2):
+        ok, rows, cols = _candidates(score, gate, min_score)
+        mapping = {}
+        for rs, cs in _components(rows, cols, score.shape[0]):
+            sub = np.ix_(rs, cs)
+            for i, j in _solve_dense(score[sub], ok[sub], solver):
+                mapping[cs[j]] = rs[i]
+        return mapping
+    return run
+
+
+assign_hungarian = _component_backend(_hungarian)
+
+BACKENDS = {
+    "greedy": assign_greedy,
+    "hungarian": assign_hungarian,
+}
+
+
+def register_backend(name, fn):
+    BACKENDS[name] = fn
+
+
+def get_backend(name):
+    if name == "hungarian" and linear_sum_assignment is None:
+        logging.warning("scipy not installed; using greedy assignment instead of hungarian")
+        name = "greedy"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown assignment backend: {name} (choose from {sorted(BACKENDS)})")
+    return BACKENDS[name]
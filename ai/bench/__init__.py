@@ -0,0 +1,10 @@
+"""
+Offline benchmarks for the detection pipeline.
+
+Synthetic classrooms and deterministic stub models stand in for cameras and
+downloaded weights, so every stage of app.py can be timed anywhere:
+
+    cd ai
+    python -m bench.run --sizes 10 50 100 200 --out bench_baseline.json
+    python -m bench.run --sizes 10 50 100 200 --compare bench_baseline.json
+"""
@@ -0,0 +1,339 @@
+# run.py
+"""
+Per-stage timing and memory of the detection pipeline on synthetic classrooms.
+
+For every class size, a deterministic scene is rendered and each stage runs
+over the same frames: decode, the stub detector itself, merge_detections,
+extract_hist_feature, AppearanceTracker.match_and_update, head-pose solves,
+detect_faces_and_gaze, annotate + encode and the end-to-end handle_frame.
+Times are taken per call with perf_counter; a second pass per stage records
+the tracemalloc peak (Python and NumPy allocations; OpenCV's own buffers are
+not traced). Results go to JSON and can be compared against a baseline:
+
+    python -m bench.run --sizes 10 50 100 200 --frames 40 --out bench_baseline.json
+    python -m bench.run --sizes 10 50 100 200 --frames 40 --compare bench_baseline.json --tolerance 0.25
+
+Everything runs offline; no weights are downloaded and no camera is opened.
+"""
+
+import os
+
+# before app.py reads its config: load the stubs synchronously and skip the batching window,
+# which would only add latency for a single sequential caller
+os.environ.setdefault("MODEL_LOAD_MODE", "eager")
+os.environ.setdefault("BATCH_WINDOW_MS", "0")
+os.environ.setdefault("FACEMESH_POOL_SIZE", "1")
+
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import app
+from bench import stubs
+from bench.synthetic import ClassroomScene, detector_runs
+from evidence_writer import EvidenceWriter
+from head_pose import solve_head_pose
+from session_registry import TrackerRegistry
+from tiling import plan_tiles
+
+NOISE_FLOOR_MS = 0.05   # p50 changes smaller than this are never reported as regressions
+
+
+# ------------------------ Inputs ------------------------
+class BenchContext:
+    """Frames and every precomputed input the stages consume (built once per class size, untimed)."""
+
+    def __init__(self, n, frames, width, height, seed):
+        self.n = n
+        scene = ClassroomScene(n, width, height, seed=seed)
+        self.size = (height, width)
+        self.states, self.images, self.jpegs = [], [], []
+        self.runs, self.boxes, self.rois, self.features, self.landmarks = [], [], [], [], []
+        for i in range(frames):
+            state = scene.state(i)
+            img = scene.render(state)
+            runs = detector_runs(state, i, size=(width, height), seed=seed)
+            boxes, _ = app.merge_detections(runs)
+            rois = [img[max(0, y1):min(height - 1, y2), max(0, x1):min(width - 1, x2)] for x1, y1, x2, y2 in boxes]
+            self.states.append(state)
+            self.images.append(img)
+            self.jpegs.append(cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+            self.runs.append(runs)
+            self.boxes.append(boxes)
+            self.rois.append(rois)
+            self.features.append([app.extract_hist_feature(r) for r in rois])
+            self.landmarks.append([(p.pid, stubs.landmarks_for_yaw(int(round(yaw))).landmark)
+                                   for p, _, yaw, visible in state if visible])
+        # per-frame outputs of the stages, summed into the baseline's behaviour checks
+        self.overlays = [[] for _ in range(frames)]
+        self.merged = [0] * frames
+        self.faces = [0] * frames
+        self.suspicious = [0] * frames
+        self.tracks_created = 0
+
+    def checks(self, stage_names):
+        out = {}
+        if "merge_detections" in stage_names:
+            out["mergedBoxes"] = sum(self.merged)
+        if "match_and_update" in stage_names:
+            out["tracksCreated"] = self.tracks_created
+        if "detect_faces_and_gaze" in stage_names:
+            out["faces"] = sum(self.faces)
+            out["suspiciousFrames"] = sum(self.suspicious)
+        return out
+
+    def __len__(self):
+        return len(self.images)
+
+
+# ------------------------ Stages ------------------------
+# each stage is (setup(ctx), step(ctx, frame_index)); setup resets any state carried across frames
+
+def _no_setup(ctx):
+    pass
+
+
+def _decode(ctx, i):
+    app.decode_image_bytes(ctx.jpegs[i])
+
+
+def _stub_detect(ctx, i):
+    stubs.find_faces(ctx.images[i])
+
+
+def _merge(ctx, i):
+    boxes, _ = app.merge_detections(ctx.runs[i])
+    ctx.merged[i] = len(boxes)
+
+
+def _hist(ctx, i):
+    for roi in ctx.rois[i]:
+        app.extract_hist_feature(roi)
+
+
+def _tracker_setup(ctx):
+    ctx.tracker = app.AppearanceTracker()
+
+
+def _track(ctx, i):
+    ctx.tracker.match_and_update(ctx.boxes[i], ctx.features[i], i + 1)
+    ctx.tracks_created = ctx.tracker.next_id - 1
+
+
+def _pose_setup(ctx):
+    ctx.poses = {}
+
+
+def _pose(ctx, i):
+    for pid, landmarks in ctx.landmarks[i]:
+        ctx.poses[pid] = solve_head_pose(landmarks, ctx.size, guess=ctx.poses.get(pid))
+
+
+def _sessions_setup(ctx):
+    ctx.sessions = TrackerRegistry(app.AppearanceTracker)
+
+
+def _pipeline(ctx, i):
+    with ctx.sessions.session("bench") as session:
+        students, suspicious, _, overlays, _ = app.detect_faces_and_gaze(ctx.images[i], session)
+    ctx.overlays[i] = overlays
+    ctx.faces[i] = len(students)
+    ctx.suspicious[i] = int(suspicious)
+
+
+def _annotate_encode(ctx, i):
+    app.encode_image(app.render_annotations(ctx.images[i].copy(), ctx.overlays[i]))
+
+
+def _handle_setup(ctx):
+    app.sessions = TrackerRegistry(app.AppearanceTracker)
+
+
+def _handle(ctx, i):
+    app.handle_frame(ctx.jpegs[i], {"sessionId": "bench", "response": "lean"})
+
+
+STAGES = [
+    ("decode", _no_setup, _decode),
+    ("stub_detect", _no_setup, _stub_detect),
+    ("merge_detections", _no_setup, _merge),
+    ("extract_hist_feature", _no_setup, _hist),
+    ("match_and_update", _tracker_setup, _track),
+    ("solve_head_pose", _pose_setup, _pose),
+    ("detect_faces_and_gaze", _sessions_setup, _pipeline),
+    ("annotate_encode", _no_setup, _annotate_encode),    # uses the overlays detect_faces_and_gaze produced
+    ("handle_frame", _handle_setup, _handle),
+]
+STAGE_NAMES = [name for name, _, _ in STAGES]
+
+
+# ------------------------ Measurement ------------------------
+def summarise(samples_ms, faces):
+    a = np.array(samples_ms, dtype=np.float64)
+    return {
+        "calls": len(a),
+        "meanMs": round(float(a.mean()), 4),
+        "p50Ms": round(float(np.percentile(a, 50)), 4),
+        "p95Ms": round(float(np.percentile(a, 95)), 4),
+        "maxMs": round(float(a.max()), 4),
+        "perFaceUs": round(float(a.mean()) * 1000.0 / faces, 3) if faces else None,
+    }
+
+
+def time_stage(ctx, setup, step, warmup):
+    setup(ctx)
+    for i in range(min(warmup, len(ctx))):
+        step(ctx, i)
+    setup(ctx)
+    samples = []
+    for i in range(len(ctx)):
+        t0 = time.perf_counter()
+        step(ctx, i)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return samples
+
+
+def peak_memory(ctx, setup, step):
+    """tracemalloc peak (KiB) above the starting point while the stage runs over every frame."""
+    setup(ctx)
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    for i in range(len(ctx)):
+        step(ctx, i)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round((peak - base) / 1024.0, 1)
+
+
+def max_rss_mib():
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0, 1)
+
+
+def run_size(n, args, stages):
+    ctx = BenchContext(n, args.frames, args.width, args.height, args.seed)
+    faces = sum(len(b) for b in ctx.boxes) / len(ctx)
+    out = {"meanFaces": round(faces, 2), "stages": {}}
+    for name, setup, step in stages:
+        row = summarise(time_stage(ctx, setup, step, args.warmup), faces)
+        if not args.no_memory:
+            row["peakKiB"] = peak_memory(ctx, setup, step)
+        out["stages"][name] = row
+    out["checks"] = ctx.checks([name for name, _, _ in stages])
+    return out
+
+
+# ------------------------ Reporting ------------------------
+def print_size(n, result):
+    print(f"\nclass size {n} ({result['meanFaces']} faces/frame)")
+    header = f"{'stage':<24}{'mean ms':>10}{'p50':>10}{'p95':>10}{'max':>10}{'us/face':>10}{'peak KiB':>11}"
+    print(header)
+    print("-" * len(header))
+    for name, r in result["stages"].items():
+        per_face = r["perFaceUs"] if r["perFaceUs"] is not None else "-"
+        print(f"{name:<24}{r['meanMs']:>10}{r['p50Ms']:>10}{r['p95Ms']:>10}{r['maxMs']:>10}"
+              f"{per_face:>10}{r.get('peakKiB', '-'):>11}")
+
+
+def compare(baseline, current, tolerance):
+    """Print p50 changes against the baseline; returns the number of regressions."""
+    regressions = 0
+    print(f"\nagainst baseline (tolerance {tolerance:.0%} on p50)")
+    header = f"{'size':>6}  {'stage':<24}{'base p50':>10}{'now p50':>10}{'change':>9}"
+    print(header)
+    print("-" * len(header))
+    for size, cur in current["sizes"].items():
+        base = baseline.get("sizes", {}).get(size)
+        if base is None:
+            continue
+        for name, r in cur["stages"].items():
+            b = base["stages"].get(name)
+            if b is None:
+                continue
+            change = (r["p50Ms"] - b["p50Ms"]) / b["p50Ms"] if b["p50Ms"] > 0 else 0.0
+            bad = change > tolerance and r["p50Ms"] - b["p50Ms"] > NOISE_FLOOR_MS
+            regressions += bad
+            print(f"{size:>6}  {name:<24}{b['p50Ms']:>10}{r['p50Ms']:>10}{change:>+9.1%}{'  REGRESSION' if bad else ''}")
+        base_checks = base.get("checks", {})
+        changed = {k: (base_checks[k], v) for k, v in cur["checks"].items() if k in base_checks and base_checks[k] != v}
+        if changed:
+            print(f"{size:>6}  outputs differ from the baseline (before, now): {changed}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 200], help="Students per classroom")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", nargs="+", default=STAGE_NAMES, choices=STAGE_NAMES)
+    parser.add_argument("--no_memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--out", default=None, help="Write the results (a new baseline) here")
+    parser.add_argument("--compare", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p50 slowdown before failing")
+    args = parser.parse_args()
+
+    stubs.install(app)
+    evidence_dir = tempfile.mkdtemp(prefix="bench_evidence_")
+    app.evidence_writer = EvidenceWriter(evidence_dir, policy="drop")
+    # detect_faces_and_gaze must run before annotate_encode, which draws its overlays
+    stages = [s for s in STAGES if s[0] in args.stages or (s[0] == "detect_faces_and_gaze" and "annotate_encode" in args.stages)]
+
+    results = {
+        "meta": {
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "frames": args.frames,
+            "warmup": args.warmup,
+            "resolution": [args.width, args.height],
+            "seed": args.seed,
+            "detectorStrategy": app.DETECTOR_STRATEGY,
+            "fusionMethod": app.FUSION_METHOD,
+            "assignment": app.ASSIGNMENT_BACKEND,
+            # the stubs cost per pixel, the real detectors per pass (each letterboxes to TILE_SIZE)
+            "detectorPasses": len(plan_tiles(args.width, args.height, app.TILE_SIZE, app.TILE_OVERLAP, app.TILE_SLACK)),
+        },
+        "sizes": {},
+    }
+    print(f"{args.width}x{args.height}: {results['meta']['detectorPasses']} detector pass(es) per frame per detector")
+    for n in args.sizes:
+        results["sizes"][str(n)] = run_size(n, args, stages)
+        print_size(n, results["sizes"][str(n)])
+
+    app.evidence_writer.flush(timeout=10)
+    results["evidenceWriter"] = app.evidence_writer.stats()
+    results["maxRssMiB"] = max_rss_mib()
+    print(f"\nmax RSS {results['maxRssMiB']} MiB, evidence snapshots written to {evidence_dir}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Saved", args.out)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# stubs.py
+"""
+Deterministic stand-ins for RetinaFace, YOLO and MediaPipe FaceMesh.
+
+They find the colour-keyed faces and noses drawn by bench/synthetic.py with
+a threshold plus connected components, and they expose the same call
+surface app.py uses: FaceAnalysis.get(), YOLO.predict() results with
+.boxes.xyxy/.conf, and FaceMesh.process().multi_face_landmarks. Their own
+cost is small and is reported separately as the "stub_detect" stage, so it
+can be told apart from the pipeline's work.
+"""
+
+import math
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from bench.synthetic import NOSE_SHIFT
+from facemesh_pool import FaceMeshPool
+from head_pose import LANDMARK_IDX, MODEL_3D
+from model_manager import ModelManager
+
+SKIN_LO, SKIN_HI = (0, 80, 80), (23, 255, 255)
+NOSE_LO, NOSE_HI = (0, 0, 0), (39, 39, 39)
+MESH_POINTS = 468
+
+
+def find_faces(img, min_area=40):
+    """(boxes, scores) of the skin-keyed blobs in a BGR frame or tile."""
+    mask = cv2.inRange(img, SKIN_LO, SKIN_HI)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    boxes, scores = [], []
+    for x, y, w, h, area in stats[1:count]:
+        if area < min_area:
+            continue
+        boxes.append((int(x), int(y), int(x + w), int(y + h)))
+        scores.append(round(0.5 + 0.45 * min(1.0, area / 2500.0), 4))     # small faces fall below the cascade gate
+    return boxes, scores
+
+
+# ------------------------ RetinaFace ------------------------
+class _Face:
+    __slots__ = ("bbox", "det_score")
+
+    def __init__(self, bbox, det_score):
+        self.bbox = np.array(bbox, dtype=np.float32)
+        self.det_score = det_score
+
+
+class StubRetinaFace:
+    def get(self, img):
+        boxes, scores = find_faces(img)
+        return [_Face(b, s) for b, s in zip(boxes, scores)]
+
+
+# ------------------------ YOLO ------------------------
+class _Box:
+    __slots__ = ("xyxy", "conf")
+
+    def __init__(self, box, score):
+        self.xyxy = np.array([box], dtype=np.float32)
+        self.conf = np.array([score], dtype=np.float32)
+
+
+class _Result:
+    __slots__ = ("boxes",)
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StubYolo:
+    backend_name = "stub"
+
+    def predict(self, imgs, **kwargs):
+        if not isinstance(imgs, list):
+            imgs = [imgs]
+        out = []
+        for img in imgs:
+            boxes, scores = find_faces(img)
+            # looser boxes and lower scores than the primary, like the real fallback
+            out.append(_Result([_Box((x1 - 3, y1 - 3, x2 + 3, y2 + 3), s * 0.9)
+                                for (x1, y1, x2, y2), s in zip(boxes, scores)]))
+        return out
+
+
+# ------------------------ FaceMesh ------------------------
+class _Landmark:
+    __slots__ = ("x", "y", "z")
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        self.z = 0.0
+
+
+class _FaceLandmarks:
+    __slots__ = ("landmark",)
+
+    def __init__(self, landmark):
+        self.landmark = landmark
+
+
+class _MeshResult:
+    __slots__ = ("multi_face_landmarks",)
+
+    def __init__(self, faces):
+        self.multi_face_landmarks = faces
+
+
+@lru_cache(maxsize=256)
+def landmarks_for_yaw(yaw):
+    """Normalised FaceMesh-style landmarks of the head model turned by `yaw` degrees (only LANDMARK_IDX are real)."""
+    a = math.radians(yaw)
+    rot = np.array([[math.cos(a), 0.0, math.sin(a)], [0.0, 1.0, 0.0], [-math.sin(a), 0.0, math.cos(a)]])
+    pts = MODEL_3D @ rot.T
+    z = pts[:, 2] + 2000.0
+    xs, ys = 0.5 + pts[:, 0] / z, 0.5 - pts[:, 1] / z
+    landmark = [_Landmark(0.5, 0.5) for _ in range(MESH_POINTS)]
+    for k, i in enumerate(LANDMARK_IDX):
+        landmark[i] = _Landmark(float(xs[k]), float(ys[k]))
+    return _FaceLandmarks(landmark)
+
+
+class StubFaceMesh:
+    def process(self, rgb):
+        mask = cv2.inRange(rgb, NOSE_LO, NOSE_HI)
+        m = cv2.moments(mask, binaryImage=True)
+        if m["m00"] < 3:
+            return _MeshResult(None)
+        w = rgb.shape[1]
+        yaw = (m["m10"] / m["m00"] / w - 0.5) / NOSE_SHIFT * 90.0
+        return _MeshResult([landmarks_for_yaw(int(round(max(-89.0, min(89.0, yaw)))))])
+
+    def close(self):
+        pass
+
+
+def install(app):
+    """Swap app.py's model registry for the stubs (call before any frame is processed)."""
+    models = ModelManager(mode="eager")
+    models.register("retinaface", StubRetinaFace)
+    models.register("yolo", StubYolo)
+    models.register("facemesh", lambda: FaceMeshPool(StubFaceMesh, size=1))
+    models.start()
+    app.models = models
+    return models
@@ -0,0 +1,134 @@
+# synthetic.py
+"""
+Deterministic synthetic classrooms.
+
+A scene seats `n` students on a grid and gives every one a fixed look (skin
+tone, hair, shirt), so colour histograms can tell them apart. Each frame adds
+a little head jitter, some occlusion, and students who turn sideways for
+stretches of frames. The same (n, seed, frame index) always gives the same
+frame and the same boxes.
+
+Colour key read by the stub models (bench/stubs.py):
+- face skin: B channel 0, G/R > 80
+- nose: every channel < 40, shifted sideways in proportion to yaw
+- everything else (background, hair, shirts, eyes): B channel >= 60
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+NOSE_SHIFT = 0.35       # nose offset at 90 degrees yaw, as a fraction of face width
+
+
+class Person:
+    __slots__ = ("pid", "seat", "size", "skin", "hair", "shirt", "cheater")
+
+    def __init__(self, pid, seat, size, skin, hair, shirt, cheater):
+        self.pid = pid
+        self.seat = seat        # face centre (x, y)
+        self.size = size        # face (w, h)
+        self.skin = skin
+        self.hair = hair
+        self.shirt = shirt
+        self.cheater = cheater
+
+
+class ClassroomScene:
+    def __init__(self, n, width=1920, height=1080, seed=0, cheat_rate=0.1, occlusion_rate=0.02):
+        self.n = n
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.occlusion_rate = occlusion_rate
+        rng = np.random.default_rng(seed)
+
+        cols = max(1, math.ceil(math.sqrt(n * width / height)))
+        rows = max(1, math.ceil(n / cols))
+        cw, ch = width / cols, height / rows
+        fw = max(12, int(min(cw * 0.45, ch * 0.4)))
+        fh = int(fw * 1.25)
+        self.people = []
+        for pid in range(n):
+            r, c = divmod(pid, cols)
+            seat = (int((c + 0.5) * cw), int(r * ch + ch * 0.4))
+            skin = (0, int(rng.integers(90, 180)), int(rng.integers(170, 250)))
+            hair = tuple(int(v) for v in rng.integers((60, 20, 20), (256, 200, 200)))
+            shirt = tuple(int(v) for v in rng.integers((60, 0, 0), (256, 256, 256)))
+            self.people.append(Person(pid, seat, (fw, fh), skin, hair, shirt, rng.random() < cheat_rate))
+
+        # static textured backdrop, drawn once per scene
+        bg = rng.integers(60, 200, size=(height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+        bg = cv2.resize(bg, (width, height), interpolation=cv2.INTER_LINEAR)
+        bg[..., 0] = np.maximum(bg[..., 0], 60)
+        self.background = bg
+
+    def state(self, frame_index):
+        """[(person, box, yaw, visible)] for one frame."""
+        rng = np.random.default_rng((self.seed, frame_index))
+        jitter = rng.integers(-3, 4, size=(self.n, 2))
+        noise_yaw = rng.uniform(-8.0, 8.0, size=self.n)
+        hidden = rng.random(self.n) < self.occlusion_rate
+        out = []
+        for p in self.people:
+            fw, fh = p.size
+            cx = p.seat[0] + int(jitter[p.pid, 0]) + int(2 * math.sin(frame_index / 7.0 + p.pid))
+            cy = p.seat[1] + int(jitter[p.pid, 1])
+            box = (cx - fw // 2, cy - fh // 2, cx + fw // 2, cy + fh // 2)
+            yaw = float(noise_yaw[p.pid])
+            if p.cheater and (frame_index // 10 + p.pid) % 3 == 0:
+                yaw += 55.0 if p.pid % 2 else -55.0
+            out.append((p, box, yaw, not hidden[p.pid]))
+        return out
+
+    def render(self, state):
+        img = self.background.copy()
+        for p, (x1, y1, x2, y2), yaw, visible in state:
+            if not visible:
+                continue
+            fw, fh = x2 - x1, y2 - y1
+            cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+            cv2.rectangle(img, (x1 - fw // 3, y2 + fh // 8), (x2 + fw // 3, y2 + fh), p.shirt, -1)
+            cv2.ellipse(img, (cx, y1 + fh // 6), (fw // 2 + 2, fh // 4), 0, 180, 360, p.hair, -1)
+            cv2.ellipse(img, (cx, cy), (fw // 2, fh // 2), 0, 0, 360, p.skin, -1)
+            eye_dx, eye_y, eye_r = fw // 5, cy - fh // 8, max(1, fw // 12)
+            cv2.circle(img, (cx - eye_dx, eye_y), eye_r, (255, 255, 255), -1)
+            cv2.circle(img, (cx + eye_dx, eye_y), eye_r, (255, 255, 255), -1)
+            nose_x = cx + int(NOSE_SHIFT * fw * max(-1.0, min(1.0, yaw / 90.0)))
+            cv2.circle(img, (nose_x, cy + fh // 16), max(2, fw // 10), (20, 20, 20), -1)
+        return img
+
+    def frames(self, count):
+        """[(state, image)] for frames 0..count-1."""
+        out = []
+        for i in range(count):
+            st = self.state(i)
+            out.append((st, self.render(st)))
+        return out
+
+
+def detector_runs(state, frame_index, size=(1920, 1080), seed=0, fallback_drop=0.05, false_positive_rate=0.02):
+    """
+    Box stream without pixels: the (boxes, scores) a primary and a fallback
+    detector would return for one frame. The fallback's boxes are jittered,
+    it misses a few faces and adds a few false positives, so fusion has real
+    overlaps to resolve.
+    """
+    rng = np.random.default_rng((seed, frame_index, 1))
+    primary_b, primary_s, fallback_b, fallback_s = [], [], [], []
+    for p, (x1, y1, x2, y2), _, visible in state:
+        if not visible:
+            continue
+        primary_b.append((x1, y1, x2, y2))
+        primary_s.append(0.55 + 0.4 * ((p.pid * 37) % 100) / 100.0)
+        if rng.random() < fallback_drop:
+            continue
+        dx1, dy1, dx2, dy2 = (int(v) for v in rng.integers(-4, 5, size=4))
+        fallback_b.append((x1 + dx1, y1 + dy1, x2 + dx2, y2 + dy2))
+        fallback_s.append(float(rng.uniform(0.3, 0.9)))
+    for _ in range(rng.binomial(len(state), false_positive_rate)):
+        x, y = int(rng.integers(0, size[0] - 40)), int(rng.integers(0, size[1] - 50))
+        fallback_b.append((x, y, x + 40, y + 50))
+        fallback_s.append(float(rng.uniform(0.25, 0.4)))
+    return [(primary_b, primary_s), (fallback_b, fallback_s)]
@@ -0,0 +1,87 @@
+# box_fusion.py
+"""
+Fusing face boxes from several detectors and/or tiles.
+
+Every candidate keeps its detector confidence. "nms" keeps the highest-scoring
+box of each overlapping group (cv2.dnn.NMSBoxes). "wbf" (weighted box fusion)
+replaces each group with the score-weighted average box, which is steadier
+when two detectors disagree by a few pixels. Both work on [N,4] arrays, so
+hundreds of candidates from tiled multi-detector inference stay cheap.
+"""
+
+import numpy as np
+import cv2
+
+METHODS = ("nms", "wbf")
+
+
+def iou_matrix(a, b):
+    """IoU between rows of a [N,4] and b [M,4] (x1, y1, x2, y2) -> [N,M]."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = np.clip(a[:, 2] - a[:, 0], 0, None) * np.clip(a[:, 3] - a[:, 1], 0, None)
+    area_b = np.clip(b[:, 2] - b[:, 0], 0, None) * np.clip(b[:, 3] - b[:, 1], 0, None)
+    union = area_a[:, None] + area_b[None, :] - inter
+    return inter / np.where(union > 0, union, 1.0)
+
+
+def nms(boxes, scores, iou_thresh=0.35, score_thresh=0.0):
+    """Indices of the boxes kept by greedy NMS, highest score first."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=int)
+    xywh = np.column_stack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]])
+    keep = cv2.dnn.NMSBoxes(xywh.tolist(), [float(s) for s in scores], score_thresh, iou_thresh)
+    return np.asarray(keep, dtype=int).reshape(-1)
+
+
+def weighted_box_fusion(boxes, scores, iou_thresh=0.35, n_sources=1):
+    """
+    Group boxes greedily around the best remaining box and average each group.
+    n_sources: detectors that contributed; a group found by fewer of them gets a proportionally lower score
+    returns (fused boxes [K,4] float, fused scores [K])
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    if len(boxes) == 0:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32)
+    iou = iou_matrix(boxes, boxes)
+    free = np.ones(len(boxes), dtype=bool)
+    fused, fused_scores = [], []
+    for i in np.argsort(-scores, kind="stable"):
+        if not free[i]:
+            continue
+        members = np.flatnonzero(free & (iou[i] > iou_thresh))
+        members = members if len(members) else np.array([i])
+        free[members] = False
+        w = scores[members]
+        fused.append((boxes[members] * w[:, None]).sum(axis=0) / max(float(w.sum()), 1e-6))
+        fused_scores.append(float(w.mean()) * min(len(members), n_sources) / n_sources)
+    return np.array(fused, dtype=np.float32), np.array(fused_scores, dtype=np.float32)
+
+
+def fuse_boxes(runs, iou_thresh=0.35, method="nms"):
+    """
+    runs: list of (boxes, scores) from each detector / tile pass
+    returns (boxes as int (x1, y1, x2, y2) tuples, scores), highest score first
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown fusion method: {method}")
+    n_sources = len(runs)
+    runs = [(b, s) for b, s in runs if len(b)]
+    if not runs:
+        return [], []
+    boxes = np.concatenate([np.asarray(b, dtype=np.float32).reshape(-1, 4) for b, _ in runs])
+    scores = np.concatenate([np.asarray(s, dtype=np.float32).reshape(-1) for _, s in runs])
+    if method == "wbf":
+        boxes, scores = weighted_box_fusion(boxes, scores, iou_thresh, n_sources=n_sources)
+    else:
+        keep = nms(boxes, scores, iou_thresh)
+        boxes, scores = boxes[keep], scores[keep]
+    out = [tuple(int(round(v)) for v in b) for b in boxes]
+    return out, [float(s) for s in scores]
@@ -0,0 +1,106 @@
+# capture.py
+"""
+Threaded cv2.VideoCapture reader.
+
+A background thread decodes the source continuously. For live sources, slow
+inference then skips stale frames instead of building an ever-growing
+backlog in the RTSP/driver buffers.
+
+policy "latest": read() always returns the newest decoded frame; older unread frames are dropped
+policy "queue":  read() returns frames in order from a bounded queue; the oldest is dropped when full
+policy "auto":   "latest" for cameras / network streams, lossless "queue" for video files
+"""
+
+import threading
+import time
+from collections import deque
+
+import cv2
+
+LIVE_PREFIXES = ("rtsp://", "rtsps://", "rtmp://", "http://", "https://", "udp://", "tcp://")
+
+
+def is_live_source(source):
+    s = str(source)
+    return s.isdigit() or s.lower().startswith(LIVE_PREFIXES)
+
+
+class ThreadedCapture:
+    def __init__(self, source, policy="auto", queue_size=4):
+        live = is_live_source(source)
+        if policy == "auto":
+            policy = "latest" if live else "queue"
+        if policy not in ("latest", "queue"):
+            raise ValueError(f"Unknown capture policy: {policy}")
+        self.policy = policy
+        # a queued file is not real-time, so never drop its frames, just pause decoding
+        self.block = policy == "queue" and not live
+        self.cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+        self._capacity = 1 if policy == "latest" else max(1, queue_size)
+        self._frames = deque(maxlen=None if self.block else self._capacity)
+        self._cond = threading.Condition()
+        self._ended = False
+        self._stopped = False
+        self.decoded = 0
+        self.dropped = 0
+        self.processed = 0
+        self._thread = None
+        if self.cap.isOpened():
+            self._thread = threading.Thread(target=self._run, name="capture", daemon=True)
+            self._thread.start()
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def _run(self):
+        while not self._stopped:
+            ret, frame = self.cap.read()
+            with self._cond:
+                if not ret:
+                    self._ended = True
+                    self._cond.notify_all()
+                    return
+                self.decoded += 1
+                if self.block:
+                    while len(self._frames) >= self._capacity and not self._stopped:
+                        self._cond.wait(0.1)
+                elif len(self._frames) == self._frames.maxlen:
+                    self.dropped += 1     # deque drops the oldest on append
+                self._frames.append((time.time(), frame))
+                self._cond.notify_all()
+
+    def read(self, timeout=None):
+        """
+        Same contract as cv2.VideoCapture.read(): (ret, frame). With a timeout, (False, None)
+        may also mean no frame arrived in time; ended() tells the two apart.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frames or self._ended or self._stopped, timeout):
+                return False, None
+            if not self._frames:
+                return False, None
+            _, frame = self._frames.popleft()
+            self.processed += 1
+            self._cond.notify_all()
+            return True, frame
+
+    def ended(self):
+        """True once the source is exhausted (or released) and every decoded frame has been read."""
+        with self._cond:
+            return (self._ended or self._stopped) and not self._frames
+
+    def stats(self):
+        with self._cond:
+            return {"policy": self.policy, "decoded": self.decoded,
+                    "processed": self.processed, "dropped": self.dropped}
+
+    def release(self):
+        self._stopped = True
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        self.cap.release()
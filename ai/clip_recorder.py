@@ -0,0 +1,182 @@
+# clip_recorder.py
+"""
+Alert clip recorder that runs beside the detection loop.
+
+The main loop calls `trigger()` when an alert fires and `feed()` with every
+frame it reads. Encoding and disk I/O happen on the recorder's own thread,
+so detection keeps running at full rate during the post-roll. Several clips
+may be open at once. An alert that arrives within `merge_gap_sec` of the
+previous alert of an open clip extends that clip instead of starting a new
+one, up to `max_clip_sec`.
+
+Queued post-roll frames are full-resolution images, so the queue is bounded
+by bytes (`max_bytes`) as well as by count. A frame that would go past
+either limit is dropped and counted rather than held in memory.
+"""
+
+import os
+import queue
+import threading
+import itertools
+import logging
+
+import cv2
+
+
+class _Clip:
+    def __init__(self, cid, path, fps, start_ts, end_ts, size=None):
+        self.id = cid
+        self.path = path
+        self.fps = fps
+        self.size = size            # (w, h) of the clip; None = first frame written
+        self.start_ts = start_ts
+        self.last_alert_ts = start_ts
+        self.end_ts = end_ts
+        # recorder-thread side
+        self.writer = None
+        self.last_ts = float("-inf")
+        self.frames = 0
+
+
+class ClipRecorder:
+    def __init__(self, post_sec=3.0, merge_gap_sec=2.0, max_clip_sec=30.0, max_queue=512, max_bytes=256 * 2**20,
+                 fourcc="mp4v"):
+        self.post_sec = post_sec
+        self.merge_gap_sec = merge_gap_sec
+        self.max_clip_sec = max_clip_sec
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.max_bytes = max_bytes
+        self._queued_bytes = 0      # frame bytes waiting in the queue
+        self._bytes_lock = threading.Lock()
+        self._dropping = False
+        self._ids = itertools.count(1)
+        self._open = []             # main-thread view of clips still accepting frames
+        self._until = float("-inf") # latest end_ts of any open clip
+        self.dropped_frames = 0
+        self.lost_preroll = 0       # pre-roll frames recycled by the buffer before the recorder read them
+        self._thread = threading.Thread(target=self._run, name="clip-recorder", daemon=True)
+        self._thread.start()
+
+    # ------------------------ main-thread API ------------------------
+    @property
+    def recording(self):
+        return bool(self._open)
+
+    def trigger(self, path, prebuf, ts, fps, decode=None, size=None):
+        """
+        Start (or extend) a clip for an alert at time `ts`.
+        prebuf: list of (ts, payload) already buffered before the alert (written first)
+        decode: turns a prebuf payload into a BGR frame on the recorder thread (None = already a frame);
+                it may return None for a payload that is no longer available, which is skipped
+        fps: frame rate of the loop feeding the recorder; the pre-roll's own timestamps take precedence
+        size: (w, h) of the live frames passed to feed(); a downscaled pre-roll is resized up to it
+        returns the path of the clip that will contain this alert
+        """
+        if len(prebuf) >= 2 and prebuf[-1][0] > prebuf[0][0]:
+            # clips play back at the rate frames were actually fed, not the camera's nominal fps
+            fps = (len(prebuf) - 1) / (prebuf[-1][0] - prebuf[0][0])
+        self._open = [c for c in self._open if c.end_ts >= ts]
+        for clip in self._open:
+            if ts - clip.last_alert_ts <= self.merge_gap_sec and ts - clip.start_ts < self.max_clip_sec:
+                clip.last_alert_ts = ts
+                clip.end_ts = min(ts + self.post_sec, clip.start_ts + self.max_clip_sec)
+                self._until = max(self._until, clip.end_ts)
+                self._queue.put(("extend", clip.id, clip.end_ts))
+                return clip.path
+
+        clip = _Clip(next(self._ids), path, fps, ts, ts + self.post_sec, size)
+        self._open.append(clip)
+        self._until = max(self._until, clip.end_ts)
+        # alerts must never be lost, so control messages block rather than drop
+        self._queue.put(("open", clip, prebuf, decode))
+        return clip.path
+
+    def feed(self, ts, frame):
+        """Hand a frame to any open clip; returns immediately (frames are dropped if the writer lags)."""
+        if ts > self._until:
+            if self._open:
+                self._open = []
+                # one tick past the end lets the recorder thread finalize the last clip now, not at close()
+                self._queue.put(("tick", ts))
+            return
+        with self._bytes_lock:
+            fits = self._queued_bytes + frame.nbytes <= self.max_bytes
+            if fits:
+                self._queued_bytes += frame.nbytes
+        if fits:
+            try:
+                self._queue.put_nowait(("frame", ts, frame))
+            except queue.Full:
+                fits = False
+                with self._bytes_lock:
+                    self._queued_bytes -= frame.nbytes
+        if not fits:
+            self.dropped_frames += 1
+            if not self._dropping:
+                logging.warning(f"Clip writer is behind: dropping post-roll frames ({self.dropped_frames} so far)")
+        self._dropping = not fits
+
+    def close(self, timeout=None):
+        """Finish writing everything queued so far and release all writers."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # ------------------------ recorder thread ------------------------
+    def _run(self):
+        active = {}
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            kind = item[0]
+            try:
+                if kind == "open":
+                    _, clip, prebuf, decode = item
+                    active[clip.id] = clip
+                    for ts, payload in prebuf:
+                        if ts > clip.last_ts:
+                            frame = decode(payload) if decode else payload
+                            if frame is None:
+                                self.lost_preroll += 1
+                                continue
+                            self._write(clip, ts, frame)
+                elif kind == "extend":
+                    _, cid, end_ts = item
+                    if cid in active:
+                        active[cid].end_ts = end_ts
+                elif kind in ("frame", "tick"):
+                    ts, frame = item[1], item[2] if kind == "frame" else None
+                    if frame is not None:
+                        with self._bytes_lock:
+                            self._queued_bytes -= frame.nbytes
+                    for cid, clip in list(active.items()):
+                        if ts > clip.end_ts:
+                            self._finish(clip)
+                            del active[cid]
+                        elif frame is not None:
+                            self._write(clip, ts, frame)
+            except Exception as e:
+                logging.warning(f"Clip recorder error: {e}")
+        for clip in active.values():
+            self._finish(clip)
+
+    def _write(self, clip, ts, frame):
+        if ts <= clip.last_ts:
+            return
+        if clip.size is None:
+            clip.size = (frame.shape[1], frame.shape[0])
+        if clip.writer is None:
+            os.makedirs(os.path.dirname(clip.path) or ".", exist_ok=True)
+            clip.writer = cv2.VideoWriter(clip.path, self.fourcc, clip.fps, clip.size)
+        if (frame.shape[1], frame.shape[0]) != clip.size:
+            # pre-roll may have been stored downscaled
+            frame = cv2.resize(frame, clip.size)
+        clip.writer.write(frame)
+        clip.last_ts = ts
+        clip.frames += 1
+
+    def _finish(self, clip):
+        if clip.writer is not None:
+            clip.writer.release()
+        print(f"Saved clip {clip.path} ({clip.frames} frames)")
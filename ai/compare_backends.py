@@ -0,0 +1,138 @@
+# compare_backends.py
+"""
+Accuracy / latency comparison of YOLO inference backends on local sample frames.
+
+The first variant is the reference (normally torch fp32). Every other variant is
+scored against its detections: recall / precision of reference boxes matched at
+IoU >= --match_iou, mean IoU of the matches and mean score drift.
+
+    python compare_backends.py --weights yolov8m.pt --frames samples/ \\
+        --variants torch onnx onnx:int8 openvino openvino:int8 --threads 4
+"""
+
+import os
+import glob
+import json
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from box_fusion import iou_matrix
+from inference_backends import load_yolo
+
+
+def load_frames(frames_dir, limit=0):
+    paths = sorted(p for ext in ("*.jpg", "*.jpeg", "*.png") for p in glob.glob(os.path.join(frames_dir, ext)))
+    if limit:
+        paths = paths[:limit]
+    frames = [cv2.imread(p) for p in paths]
+    return [(p, f) for p, f in zip(paths, frames) if f is not None]
+
+
+def run_variant(variant, frames, args):
+    backend, _, flag = variant.partition(":")
+    model = load_yolo(args.weights, backend=backend, imgsz=args.imgsz, int8=flag == "int8",
+                      threads=args.threads or None, calib_data=args.calib_data)
+    kwargs = {"imgsz": args.imgsz, "conf": args.conf, "verbose": False}
+    if args.classes:
+        kwargs["classes"] = args.classes
+    for _ in range(args.warmup):
+        model.predict(frames[0][1], **kwargs)
+    latencies, outputs = [], []
+    for _, frame in frames:
+        t0 = time.perf_counter()
+        res = model.predict(frame, **kwargs)[0]
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        outputs.append((res.boxes.xyxy.cpu().numpy().reshape(-1, 4), res.boxes.conf.cpu().numpy().reshape(-1)))
+    return model.backend_name, np.array(latencies), outputs
+
+
+def agreement(ref, out, match_iou=0.5):
+    """Greedy IoU matching of `out` against the reference boxes, frame by frame."""
+    n_ref = n_out = matched = 0
+    ious, drift = [], []
+    for (rb, rs), (ob, os_) in zip(ref, out):
+        n_ref += len(rb)
+        n_out += len(ob)
+        if not len(rb) or not len(ob):
+            continue
+        iou = iou_matrix(rb, ob)
+        while True:
+            i, j = np.unravel_index(np.argmax(iou), iou.shape)
+            if iou[i, j] < match_iou:
+                break
+            matched += 1
+            ious.append(float(iou[i, j]))
+            drift.append(abs(float(rs[i]) - float(os_[j])))
+            iou[i, :] = -1
+            iou[:, j] = -1
+    return {
+        "recall": round(matched / n_ref, 4) if n_ref else 1.0,
+        "precision": round(matched / n_out, 4) if n_out else 1.0,
+        "meanIoU": round(float(np.mean(ious)), 4) if ious else 0.0,
+        "meanScoreDrift": round(float(np.mean(drift)), 4) if drift else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weights", default="yolov8m.pt")
+    parser.add_argument("--frames", required=True, help="Folder of sample .jpg/.png frames")
+    parser.add_argument("--variants", nargs="+", default=["torch", "onnx", "onnx:int8", "openvino", "openvino:int8"],
+                        help="backend[:int8]; the first one is the accuracy reference")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--classes", type=int, nargs="*", default=None, help="e.g. 0 for persons with a COCO model")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--calib_data", default=None, help="Calibration dataset yaml for OpenVINO INT8 export")
+    parser.add_argument("--match_iou", type=float, default=0.5)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=0, help="Use at most N frames")
+    parser.add_argument("--json", default=None, help="Also write the results here")
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames, args.limit)
+    if not frames:
+        raise SystemExit(f"No frames found in {args.frames}")
+    print(f"{len(frames)} frames from {args.frames}")
+
+    results = []
+    reference = None
+    for variant in args.variants:
+        try:
+            name, lat, outputs = run_variant(variant, frames, args)
+        except Exception as e:
+            print(f"{variant}: failed ({e})")
+            continue
+        if reference is None:
+            reference = outputs
+        row = {
+            "variant": variant,
+            "backend": name,
+            "latencyMeanMs": round(float(lat.mean()), 2),
+            "latencyP50Ms": round(float(np.percentile(lat, 50)), 2),
+            "latencyP95Ms": round(float(np.percentile(lat, 95)), 2),
+            "fps": round(1000.0 / float(lat.mean()), 2),
+            "detections": int(sum(len(b) for b, _ in outputs)),
+        }
+        row.update(agreement(reference, outputs, args.match_iou))
+        results.append(row)
+
+    header = f"{'variant':<16}{'mean ms':>9}{'p50':>9}{'p95':>9}{'fps':>8}{'dets':>7}{'recall':>8}{'prec':>8}{'mIoU':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['variant']:<16}{r['latencyMeanMs']:>9}{r['latencyP50Ms']:>9}{r['latencyP95Ms']:>9}{r['fps']:>8}"
+              f"{r['detections']:>7}{r['recall']:>8}{r['precision']:>8}{r['meanIoU']:>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"weights": args.weights, "imgsz": args.imgsz, "frames": len(frames),
+                       "threads": args.threads, "results": results}, f, indent=2)
+        print("Saved", args.json)
+
+
+if __name__ == "__main__":
+    main()
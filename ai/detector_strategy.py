@@ -0,0 +1,122 @@
+# detector_strategy.py
+"""
+How the face detectors are combined for one frame.
+
+Each detector is a callable img -> (boxes, scores). The engine runs them
+under a named strategy:
+
+- "primary":    primary detector only
+- "cascade":    primary first; the fallback runs only when the primary result
+                looks weak (its least confident box is below `min_conf`, or it
+                found fewer faces than `min_faces` / the faces we are currently
+                tracking)
+- "concurrent": both detectors on every frame, the fallback on a worker thread
+                while the primary runs on the calling thread
+
+Hit rate and latency are counted per strategy, so they can be compared on live
+traffic.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+STRATEGIES = ("primary", "cascade", "concurrent")
+
+
+class _StrategyStats:
+    def __init__(self, window=512):
+        self.frames = 0
+        self.fallback_calls = 0
+        self.fallback_hits = 0      # fallback calls that returned at least one box
+        self.latency = deque(maxlen=window)
+        self.detector_ms = {}
+
+    def snapshot(self):
+        lat = np.array(self.latency) if self.latency else np.zeros(1)
+        return {
+            "frames": self.frames,
+            "fallbackCalls": self.fallback_calls,
+            "fallbackRate": round(self.fallback_calls / self.frames, 4) if self.frames else 0.0,
+            "fallbackHitRate": round(self.fallback_hits / self.fallback_calls, 4) if self.fallback_calls else 0.0,
+            "latencyAvgMs": round(float(lat.mean()), 3),
+            "latencyP95Ms": round(float(np.percentile(lat, 95)), 3),
+            "latencyMaxMs": round(float(lat.max()), 3),
+            "detectorAvgMs": {name: round(total / calls, 3) for name, (calls, total) in self.detector_ms.items()},
+        }
+
+
+class DetectorEngine:
+    def __init__(self, primary, fallback, strategy="cascade", min_conf=0.6, min_faces=1, max_workers=2):
+        """
+        primary / fallback: (name, detect_fn) pairs; detect_fn(img) -> (boxes, scores)
+        strategy: default strategy, one of STRATEGIES
+        max_workers: fallback threads for "concurrent"; size it to the caller's concurrent frames, or
+                     fallbacks queue here (inflating latency) and the YOLO micro-batcher sees no company
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown detector strategy: {strategy}")
+        self.primary = primary
+        self.fallback = fallback
+        self.strategy = strategy
+        self.min_conf = min_conf
+        self.min_faces = min_faces
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="detector")
+        self._lock = threading.Lock()
+        self._stats = {name: _StrategyStats() for name in STRATEGIES}
+
+    def _timed(self, detector, img):
+        name, fn = detector
+        t0 = time.perf_counter()
+        boxes, scores = fn(img)
+        return name, boxes, scores, (time.perf_counter() - t0) * 1000.0
+
+    def needs_fallback(self, boxes, scores, expected=0):
+        if len(boxes) < max(self.min_faces, expected):
+            return True
+        return len(scores) > 0 and min(scores) < self.min_conf
+
+    def detect(self, img, strategy=None, expected=0):
+        """
+        Run the detectors for one frame.
+        expected: faces currently being tracked; the cascade treats fewer detections as a weak frame
+        returns [(name, boxes, scores), ...] with the primary first
+        """
+        strategy = strategy or self.strategy
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown detector strategy: {strategy}")
+        t0 = time.perf_counter()
+        if strategy == "concurrent":
+            future = self._pool.submit(self._timed, self.fallback, img)
+            runs = [self._timed(self.primary, img), future.result()]
+        else:
+            runs = [self._timed(self.primary, img)]
+            _, boxes, scores, _ = runs[0]
+            if strategy == "cascade" and self.needs_fallback(boxes, scores, expected):
+                runs.append(self._timed(self.fallback, img))
+        total_ms = (time.perf_counter() - t0) * 1000.0
+
+        with self._lock:
+            st = self._stats[strategy]
+            st.frames += 1
+            st.latency.append(total_ms)
+            if len(runs) > 1:
+                st.fallback_calls += 1
+                st.fallback_hits += int(len(runs[1][1]) > 0)
+            for name, _, _, ms in runs:
+                calls, total = st.detector_ms.get(name, (0, 0.0))
+                st.detector_ms[name] = (calls + 1, total + ms)
+        return [(name, boxes, scores) for name, boxes, scores, _ in runs]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "default": self.strategy,
+                "strategies": {name: st.snapshot() for name, st in self._stats.items() if st.frames},
+            }
+
+    def close(self):
+        self._pool.shutdown(wait=False)
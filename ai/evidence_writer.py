@@ -0,0 +1,126 @@
+# evidence_writer.py
+"""
+Background writer for cheating snapshots.
+
+Request threads hand over an annotated frame and immediately get back the
+path it will be stored under. JPEG encoding and disk I/O happen on a worker
+thread behind a bounded queue. When the queue is full, the snapshot is either
+dropped ("drop") or the caller waits up to `block_timeout` ("block"). Names
+carry millisecond time plus a random suffix, so concurrent alerts never
+overwrite each other. Files are written to a temp name and renamed, so a path
+handed to a client never points at a half-written image.
+"""
+
+import os
+import queue
+import threading
+import time
+import uuid
+import logging
+
+import cv2
+
+
+class EvidenceWriter:
+    def __init__(self, out_dir, max_queue=64, policy="drop", block_timeout=1.0, jpeg_quality=90, timers=None):
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Unknown evidence queue policy: {policy}")
+        self.out_dir = out_dir
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.jpeg_quality = jpeg_quality
+        self.timers = timers        # optional stage_metrics.StageTimers: "evidence_encode" / "disk_write"
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.write_total = 0.0
+        os.makedirs(out_dir, exist_ok=True)
+        # the worker starts on first use, so a writer created before a fork gets its thread in the child
+        self._thread = None
+        self._pid = None
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="evidence-writer", daemon=True)
+                self._thread.start()
+
+    def unique_path(self, prefix="cheating"):
+        now = time.time()
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(now)) + f"_{int(now * 1000) % 1000:03d}"
+        return os.path.join(self.out_dir, f"{prefix}_{stamp}_{uuid.uuid4().hex[:8]}.jpg")
+
+    def submit(self, img, prefix="cheating"):
+        """Queue img for writing; returns the final path, or None if it was dropped."""
+        self._ensure_worker()
+        path = self.unique_path(prefix)
+        try:
+            if self.policy == "block":
+                self._queue.put((path, img), timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait((path, img))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            if self.timers is not None:
+                self.timers.incr("evidence_dropped_total")
+            logging.warning(f"Evidence queue full, dropped snapshot {path}")
+            return None
+        with self._lock:
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+        return path
+
+    def _run(self):
+        while True:
+            path, img = self._queue.get()
+            t0 = time.perf_counter()
+            try:
+                ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                if not ok:
+                    raise RuntimeError("JPEG encode failed")
+                t1 = time.perf_counter()
+                tmp = path + ".part"
+                with open(tmp, "wb") as f:
+                    f.write(buf.tobytes())
+                os.replace(tmp, path)
+                if self.timers is not None:
+                    self.timers.record("evidence_encode", t1 - t0)
+                    self.timers.record("disk_write", time.perf_counter() - t1)
+                with self._lock:
+                    self.written += 1
+                    self.write_total += time.perf_counter() - t0
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                logging.warning(f"Failed to write evidence {path}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is on disk (timeout in seconds, None = forever)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queueDepth": self._queue.qsize(),
+                "maxQueueDepth": self.max_depth,
+                "queueCapacity": self._queue.maxsize,
+                "policy": self.policy,
+                "submitted": self.submitted,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "writeAvgMs": round(self.write_total * 1000.0 / self.written, 3) if self.written else 0.0,
+            }
@@ -0,0 +1,128 @@
+# facemesh_pool.py
+"""
+Long-lived pool of MediaPipe FaceMesh graphs.
+
+Building a FaceMesh graph (and loading its model) is expensive, so instead of
+entering a fresh `FaceMesh(...)` per request the service keeps a fixed number
+of instances around and lends one to each request thread for the duration of
+its landmark pass.
+"""
+
+import queue
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class FaceMeshPool:
+    def __init__(self, factory, size=4):
+        """
+        factory: zero-arg callable returning a FaceMesh-like object (has .process() and .close())
+        size: maximum number of live instances (roughly one per worker thread)
+        """
+        self.factory = factory
+        self.size = max(1, int(size))
+        self._free = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+        # wait-time accounting (seconds spent blocked waiting for a free instance)
+        self.checkouts = 0
+        self.blocked = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _new_instance(self):
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            return self.factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def warm(self):
+        """Create every instance up front and push a blank frame through each one."""
+        blank = np.zeros((64, 64, 3), dtype=np.uint8)
+        meshes = []
+        while True:
+            mesh = self._new_instance()
+            if mesh is None:
+                break
+            try:
+                mesh.process(blank)
+            except Exception as e:
+                logging.warning(f"FaceMesh warm-up failed: {e}")
+            meshes.append(mesh)
+        for mesh in meshes:
+            self._free.put(mesh)
+        return len(meshes)
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """Borrow an instance; raises queue.Empty if none is free within `timeout`."""
+        mesh = None
+        waited = 0.0
+        try:
+            mesh = self._free.get_nowait()
+        except queue.Empty:
+            mesh = self._new_instance()
+            if mesh is None:
+                t0 = time.perf_counter()
+                mesh = self._free.get(timeout=timeout)
+                waited = time.perf_counter() - t0
+
+        with self._lock:
+            self.checkouts += 1
+            if waited > 0.0:
+                self.blocked += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+        healthy = True
+        try:
+            yield mesh
+        except Exception:
+            # a graph that raised mid-process may be left in a bad state; replace it lazily
+            healthy = False
+            raise
+        finally:
+            if healthy:
+                self._free.put(mesh)
+            else:
+                self._discard(mesh)
+
+    def _discard(self, mesh):
+        try:
+            mesh.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "available": self._free.qsize(),
+                "checkouts": self.checkouts,
+                "blockedCheckouts": self.blocked,
+                "waitTotalMs": round(self.wait_total * 1000.0, 3),
+                "waitAvgMs": round(self.wait_total * 1000.0 / self.checkouts, 3) if self.checkouts else 0.0,
+                "waitMaxMs": round(self.wait_max * 1000.0, 3),
+            }
+
+    def close(self):
+        while True:
+            try:
+                mesh = self._free.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(mesh)
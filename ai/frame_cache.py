@@ -0,0 +1,61 @@
+# frame_cache.py
+"""
+Short-lived store of processed frames whose annotated image has not been rendered.
+
+Lean /camera/upload responses skip drawing and JPEG/base64 encoding. Instead
+the still-encoded upload bytes and the overlay list are kept here under a
+frame id, so a client that does want the overlay can fetch it afterwards and
+pay the render cost only then.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class FrameEntry:
+    def __init__(self, source_bytes, shape, overlays):
+        self.source_bytes = source_bytes    # original encoded upload (jpeg/png/...)
+        self.shape = shape                  # (h, w) of the frame the overlays refer to
+        self.overlays = overlays
+        self.created = time.monotonic()
+
+
+class FrameCache:
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl_seconds=120.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, source_bytes, shape, overlays):
+        frame_id = uuid.uuid4().hex
+        entry = FrameEntry(source_bytes, shape, overlays)
+        with self._lock:
+            self._entries[frame_id] = entry
+            self._bytes += len(source_bytes)
+            self._expire_locked()
+        return frame_id
+
+    def get(self, frame_id):
+        with self._lock:
+            self._expire_locked()
+            return self._entries.get(frame_id)
+
+    def _expire_locked(self):
+        now = time.monotonic()
+        while self._entries:
+            frame_id, entry = next(iter(self._entries.items()))
+            if (len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+                    or now - entry.created > self.ttl):
+                del self._entries[frame_id]
+                self._bytes -= len(entry.source_bytes)
+            else:
+                break
+
+    def stats(self):
+        with self._lock:
+            return {"frames": len(self._entries), "bytes": self._bytes}
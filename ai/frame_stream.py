@@ -0,0 +1,54 @@
+# frame_stream.py
+"""
+Latest-frame hand-off for streaming camera connections.
+
+The socket reader puts every incoming frame into a single slot and a
+processing thread takes from it. If inference falls behind, a frame that
+is still waiting is replaced by the newer one and counted as dropped. A
+live proctoring view then always gets results for the most recent frame,
+and latency stays at about one inference instead of growing with a
+backlog (same policy as capture.ThreadedCapture "latest").
+"""
+
+import threading
+import time
+
+
+class LatestFrame:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+        self.taken = 0
+
+    def put(self, data):
+        """Offer a frame; returns its sequence number (1-based)."""
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1       # never started; the newer frame supersedes it
+            self.received += 1
+            self._item = (self.received, time.monotonic(), data)
+            self._cond.notify_all()
+            return self.received
+
+    def get(self, timeout=None):
+        """(seq, received_at, data) of the newest frame, or None once closed / on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._item is not None or self._closed, timeout):
+                return None
+            if self._item is None:
+                return None
+            item, self._item = self._item, None
+            self.taken += 1
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {"received": self.received, "processed": self.taken, "dropped": self.dropped}
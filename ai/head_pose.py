@@ -0,0 +1,97 @@
+# head_pose.py
+"""
+Shared head-pose estimation from MediaPipe FaceMesh landmarks.
+
+One solvePnP per face per frame:
+- the 3D model and per-resolution camera matrices are built once and reused
+- yaw comes straight from the rotation (asin(-R[2,0]), identical to
+  decomposeProjectionMatrix's euler[1]) instead of Rodrigues + decomposition
+- the solve can be warm-started from a track's previous rvec/tvec; callers
+  solve each distinct face once per frame and share the result
+"""
+
+import math
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+# MediaPipe indices used for head pose estimation (approx): nose, chin, eye corners, mouth corners
+LANDMARK_IDX = (1, 152, 33, 263, 61, 291)
+MODEL_3D = np.array([
+    (0.0, 0.0, 0.0),
+    (0.0, -330.0, -65.0),
+    (-225.0, 170.0, -135.0),
+    (225.0, 170.0, -135.0),
+    (-150.0, -150.0, -125.0),
+    (150.0, -150.0, -125.0)
+], dtype=np.float64)
+DIST_COEFFS = np.zeros((4, 1))
+
+
+class HeadPose:
+    __slots__ = ("rvec", "tvec", "yaw")
+
+    def __init__(self, rvec, tvec, yaw):
+        self.rvec = rvec
+        self.tvec = tvec
+        self.yaw = yaw          # degrees
+
+
+@lru_cache(maxsize=32)
+def camera_matrix(w, h):
+    cam = np.array([[w, 0, w / 2], [0, w, h / 2], [0, 0, 1]], dtype=np.float64)
+    cam.setflags(write=False)
+    return cam
+
+
+def image_points(landmarks, image_size):
+    h, w = image_size
+    return np.array([(landmarks[i].x * w, landmarks[i].y * h) for i in LANDMARK_IDX], dtype=np.float64)
+
+
+def yaw_from_rvec(rvec):
+    """Yaw in degrees of one Rodrigues vector (row R[2,0] of its rotation, without building R)."""
+    rx, ry, rz = (float(v) for v in np.ravel(rvec))
+    theta = math.sqrt(rx * rx + ry * ry + rz * rz)
+    if theta < 1e-12:
+        return 0.0
+    kx, ky, kz = rx / theta, ry / theta, rz / theta
+    r20 = (1.0 - math.cos(theta)) * kz * kx - math.sin(theta) * ky
+    return math.degrees(math.asin(min(1.0, max(-1.0, -r20))))
+
+
+def _solve_points(pts2d, image_size, guess=None):
+    h, w = image_size
+    cam = camera_matrix(int(w), int(h))
+    try:
+        if guess is not None:
+            ok, rvec, tvec = cv2.solvePnP(MODEL_3D, pts2d, cam, DIST_COEFFS,
+                                          guess.rvec.copy(), guess.tvec.copy(),
+                                          useExtrinsicGuess=True, flags=cv2.SOLVEPNP_ITERATIVE)
+        else:
+            ok, rvec, tvec = cv2.solvePnP(MODEL_3D, pts2d, cam, DIST_COEFFS, flags=cv2.SOLVEPNP_ITERATIVE)
+    except cv2.error:
+        return None
+    if not ok:
+        return None
+    return rvec, tvec
+
+
+def solve_head_pose(landmarks, image_size, guess=None):
+    """HeadPose for one face (None if the solve fails). guess: previous HeadPose of the same person."""
+    try:
+        pts2d = image_points(landmarks, image_size)
+    except Exception:
+        return None
+    res = _solve_points(pts2d, image_size, guess)
+    if res is None:
+        return None
+    rvec, tvec = res
+    return HeadPose(rvec, tvec, yaw_from_rvec(rvec))
+
+
+def yaw_percent(yaw, max_yaw=45.0):
+    """|yaw| as a 0-100 score saturating at max_yaw degrees."""
+    return float(min(max(abs(yaw) / max_yaw, 0), 1) * 100.0)
+
@@ -0,0 +1,188 @@
+# inference_backends.py
+"""
+CPU inference backends for the YOLO and InsightFace detectors.
+
+backend "torch":    the PyTorch .pt weights as before
+backend "onnx":     weights exported once to ONNX, run by ONNX Runtime
+backend "openvino": weights exported once to OpenVINO IR
+
+int8=True loads a quantized variant:
+- ONNX: dynamic weight quantization of the exported model (no calibration data needed)
+- OpenVINO: NNCF post-training quantization through the ultralytics exporter
+  (it needs a calibration dataset yaml, `calib_data`)
+
+Exports are cached next to the weights (one per backend / int8 / dynamic
+batch) and reused on later starts; delete one to re-export at another imgsz.
+`threads`
+caps intra-op parallelism per model, so several workers on one node do not
+oversubscribe the cores. InsightFace models are already ONNX, so for them
+only the execution provider and session options change.
+"""
+
+import os
+import logging
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+try:
+    import onnxruntime as ort
+except ImportError:  # optional dependency
+    ort = None
+
+
+def _base(weights):
+    return os.path.splitext(weights)[0]
+
+
+def export_path(weights, backend, int8=False, dynamic=False):
+    """Where the exported (and optionally quantized) model for `weights` lives."""
+    base = _base(weights)
+    if backend == "onnx":
+        return base + (".dyn" if dynamic else "") + (".int8" if int8 else "") + ".onnx"
+    if backend == "openvino":
+        return base + ("_dyn" if dynamic else "") + ("_int8" if int8 else "") + "_openvino_model"
+    return weights
+
+
+def _move(src, dst):
+    src = str(src)
+    if os.path.abspath(src) != os.path.abspath(dst):
+        os.replace(src, dst)
+    return dst
+
+
+def export_yolo(weights, backend, imgsz=640, int8=False, dynamic=False, calib_data=None):
+    """Export `weights` for `backend` unless a cached export exists; returns the model path."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    path = export_path(weights, backend, int8, dynamic)
+    if os.path.exists(path):
+        return path
+
+    from ultralytics import YOLO
+
+    if backend == "onnx":
+        fp32 = export_path(weights, "onnx", dynamic=dynamic)
+        if not os.path.exists(fp32):
+            print(f"Exporting {weights} to ONNX (imgsz={imgsz}, dynamic={dynamic})")
+            _move(YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=True), fp32)
+        if int8:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            print(f"Quantizing {fp32} to INT8")
+            quantize_dynamic(fp32, path, weight_type=QuantType.QUInt8)
+        return path if int8 else fp32
+
+    if backend == "openvino":
+        print(f"Exporting {weights} to OpenVINO (imgsz={imgsz}, int8={int8})")
+        kwargs = {"format": "openvino", "imgsz": imgsz, "dynamic": dynamic, "int8": int8}
+        if int8 and calib_data:
+            kwargs["data"] = calib_data
+        return _move(YOLO(weights).export(**kwargs), path)
+
+    return weights
+
+
+def set_torch_threads(threads):
+    if not threads:
+        return
+    try:
+        import torch
+        torch.set_num_threads(int(threads))
+    except ImportError:
+        pass
+
+
+def onnx_session_options(threads=None):
+    """ONNX Runtime session options with intra-op threads capped (None when onnxruntime is missing)."""
+    if ort is None:
+        return None
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        so.intra_op_num_threads = int(threads)
+        so.inter_op_num_threads = 1
+    return so
+
+
+def _apply_threads(model, backend, path, threads):
+    """Rebuild the runtime session of a loaded ultralytics model with a thread cap."""
+    if not threads:
+        return
+    if backend == "torch":
+        set_torch_threads(threads)
+        return
+    # the ultralytics AutoBackend is only built on the first predict
+    backend_model = getattr(getattr(model, "predictor", None), "model", None)
+    try:
+        if backend == "onnx" and ort is not None and hasattr(backend_model, "session"):
+            providers = backend_model.session.get_providers()
+            backend_model.session = ort.InferenceSession(path, onnx_session_options(threads), providers=providers)
+        elif backend == "openvino" and hasattr(backend_model, "ov_compiled_model"):
+            import openvino as ov
+            core = ov.Core()
+            xml = next(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".xml"))
+            backend_model.ov_compiled_model = core.compile_model(
+                core.read_model(xml), "CPU", {"INFERENCE_NUM_THREADS": int(threads), "PERFORMANCE_HINT": "LATENCY"})
+    except Exception as e:
+        logging.warning(f"Could not cap {backend} threads at {threads}: {e}")
+
+
+def load_yolo(weights, backend="torch", imgsz=640, int8=False, threads=None, batch=1, calib_data=None, warmup=True):
+    """
+    YOLO model on the requested backend (falls back to torch if the export fails).
+    batch > 1 exports with a dynamic batch axis, so several frames can go through one predict.
+    """
+    import numpy as np
+    from ultralytics import YOLO
+
+    path = weights
+    if backend != "torch":
+        try:
+            path = export_yolo(weights, backend, imgsz=imgsz, int8=int8, dynamic=batch > 1, calib_data=calib_data)
+        except Exception as e:
+            logging.warning(f"{backend} export of {weights} failed ({e}), using torch weights.")
+            backend = "torch"
+    model = YOLO(path, task="detect") if backend != "torch" else YOLO(path)
+    if warmup:
+        model.predict(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, verbose=False)
+    _apply_threads(model, backend, path, threads)
+    model.backend_name = backend + ("-int8" if int8 and backend != "torch" else "")
+    return model
+
+
+def insightface_kwargs(backend="torch", threads=None):
+    """
+    Extra FaceAnalysis kwargs: for "openvino", the OpenVINO execution provider (prepare() with
+    ctx_id >= 0 then, since ctx_id < 0 resets providers to CPU). insightface forwards only
+    providers / provider_options to ONNX Runtime, so the thread cap is applied afterwards
+    by cap_insightface_threads().
+    """
+    kwargs = {}
+    if backend == "openvino":
+        kwargs["providers"] = ["OpenVINOExecutionProvider", "CPUExecutionProvider"]
+    return kwargs
+
+
+def cap_insightface_threads(fa, threads):
+    """
+    Rebuild every ONNX Runtime session of a prepared FaceAnalysis with intra-op threads capped,
+    keeping its providers. Returns the number of sessions rebuilt.
+    """
+    so = onnx_session_options(threads)
+    if so is None or not threads:
+        return 0
+    rebuilt = 0
+    for name, model in getattr(fa, "models", {}).items():
+        session = getattr(model, "session", None)
+        path = getattr(model, "model_file", None) or getattr(session, "_model_path", None)
+        if session is None or path is None:
+            continue
+        providers = session.get_providers()
+        options = session.get_provider_options()
+        model.session = ort.InferenceSession(path, sess_options=so, providers=providers,
+                                             provider_options=[options.get(p, {}) for p in providers])
+        applied = model.session.get_session_options().intra_op_num_threads
+        if applied != int(threads):
+            logging.warning(f"InsightFace {name}: intra-op threads {applied}, expected {threads}")
+        rebuilt += 1
+    return rebuilt
@@ -0,0 +1,121 @@
+# micro_batcher.py
+"""
+Micro-batching of concurrent detector calls.
+
+Request threads call submit(item) and block; submit_many(items) queues all
+of one request's items (e.g. the tiles of a frame) together, so they share
+a batch instead of each waiting out its own window. One batcher thread collects the
+items that arrive within `window_ms` of the first waiting item, or up to
+`max_batch` of them, runs a single batch_fn(items) call and hands each
+caller its own result. When thirty classrooms post frames at once this turns
+thirty batch-of-one detector passes into a few batched ones. It also means
+only one thread ever drives the detector, which ultralytics predictors need
+anyway.
+
+stats() reports a batch-size histogram, the queueing delay (submit until
+the batch starts) and the batch run time.
+"""
+
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    def __init__(self, batch_fn, max_batch=8, window_ms=5.0, name="batcher", window=1024):
+        """
+        batch_fn(list of items) -> list of results (same order and length)
+        window_ms: how long the first item waits for company; 0 batches only what is already queued
+        """
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, int(max_batch))
+        self.window = max(0.0, window_ms) / 1000.0
+        self.name = name
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.sizes = Counter()
+        self.queue_delay = deque(maxlen=window)     # seconds per item
+        self.run_time = deque(maxlen=window)        # seconds per batch
+
+    def _ensure_worker(self):
+        # started on first use (and again after a fork) so the thread lives in the process that serves
+        with self._cond:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, item, timeout=None):
+        """Result of batch_fn for this item (exceptions from the batch are re-raised here)."""
+        return self.submit_many([item], timeout)[0]
+
+    def submit_many(self, items, timeout=None):
+        """Results for several items queued at once, in order."""
+        # even without a window every call goes through the batcher thread, so one thread drives batch_fn
+        self._ensure_worker()
+        futures = [Future() for _ in items]
+        now = time.perf_counter()
+        with self._cond:
+            self._queue.extend((now, item, fut) for item, fut in zip(items, futures))
+            self._cond.notify()
+        return [fut.result(timeout) for fut in futures]
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = self._queue[0][0] + self.window
+            while len(self._queue) < self.max_batch:
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            n = min(len(self._queue), self.max_batch)
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            start = time.perf_counter()
+            try:
+                results = self.batch_fn([item for _, item, _ in batch])
+                for (_, _, fut), res in zip(batch, results):
+                    fut.set_result(res)
+            except Exception as e:
+                for _, _, fut in batch:
+                    fut.set_exception(e)
+            self._record([start - t for t, _, _ in batch], time.perf_counter() - start)
+
+    def _record(self, delays, run_time):
+        with self._lock:
+            self.batches += 1
+            self.items += len(delays)
+            self.sizes[len(delays)] += 1
+            self.queue_delay.extend(delays)
+            self.run_time.append(run_time)
+
+    def stats(self):
+        with self._lock:
+            delay = np.array(self.queue_delay) * 1000.0 if self.queue_delay else np.zeros(1)
+            run = np.array(self.run_time) * 1000.0 if self.run_time else np.zeros(1)
+            return {
+                "maxBatch": self.max_batch,
+                "windowMs": round(self.window * 1000.0, 3),
+                "batches": self.batches,
+                "items": self.items,
+                "avgBatchSize": round(self.items / self.batches, 3) if self.batches else 0.0,
+                "batchSizeHistogram": {str(k): v for k, v in sorted(self.sizes.items())},
+                "queueDelayAvgMs": round(float(delay.mean()), 3),
+                "queueDelayP95Ms": round(float(np.percentile(delay, 95)), 3),
+                "queueDelayMaxMs": round(float(delay.max()), 3),
+                "batchRunAvgMs": round(float(run.mean()), 3),
+            }
@@ -0,0 +1,149 @@
+# model_manager.py
+"""
+Loads the service's models off the import path.
+
+Importing app.py used to load RetinaFace, YOLO and the FaceMesh pool
+before anything else could happen. The manager instead keeps a loader per
+model and loads them:
+
+- "background": on a daemon thread once start() is called; requests wait for
+  the model they need, /readyz reports 503 until every model is loaded
+- "lazy": each model on the first request that needs it
+- "eager": all of them synchronously in start()
+
+Each model can be warmed with one dummy inference after loading, so the
+first real request does not pay for graph compilation and allocator growth.
+
+preload() loads, in the calling process, only the models registered as
+fork_safe (plain weights, no runtime threads yet). Run under a pre-forking
+server's master, those weights are shared copy-on-write by every worker.
+Runtime sessions, graphs and warm-up are built per worker by start() after
+the fork.
+"""
+
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+MODES = ("background", "lazy", "eager")
+
+
+class ModelNotReady(Exception):
+    pass
+
+
+class _Entry:
+    def __init__(self, name, loader, warmup, fork_safe):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.fork_safe = fork_safe
+        self.model = None
+        self.warm = False
+        self.error = None
+        self.load_ms = None
+        self.warmup_ms = None
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+
+class ModelManager:
+    def __init__(self, mode="background"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown model load mode: {mode}")
+        self.mode = mode
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.started = False
+
+    def register(self, name, loader, warmup=None, fork_safe=False):
+        """loader() -> model; warmup(model) runs one dummy inference."""
+        self._entries[name] = _Entry(name, loader, warmup, fork_safe)
+
+    # ------------------------ loading ------------------------
+    def _load(self, entry, warm=True):
+        with entry.lock:
+            try:
+                if entry.model is None:
+                    t0 = time.perf_counter()
+                    entry.model = entry.loader()
+                    entry.load_ms = (time.perf_counter() - t0) * 1000.0
+                    print(f"Model {entry.name} loaded in {entry.load_ms:.0f} ms")
+                if warm and not entry.warm:
+                    if entry.warmup is not None:
+                        t0 = time.perf_counter()
+                        entry.warmup(entry.model)
+                        entry.warmup_ms = (time.perf_counter() - t0) * 1000.0
+                    entry.warm = True
+                    entry.done.set()
+            except Exception as e:
+                entry.error = str(e)
+                entry.done.set()
+                logging.exception(f"Loading model {entry.name} failed")
+        return entry.model
+
+    def _load_all(self):
+        for entry in self._entries.values():
+            self._load(entry)
+
+    def preload(self):
+        """Load fork-safe weights in this process (e.g. a pre-forking server's master), without warm-up."""
+        for entry in self._entries.values():
+            if entry.fork_safe:
+                self._load(entry, warm=False)
+
+    def start(self):
+        """Begin loading according to the mode (idempotent; call once per process, after any fork)."""
+        with self._lock:
+            if self.started:
+                return
+            self.started = True
+        if self.mode == "eager":
+            self._load_all()
+        elif self.mode == "background":
+            self._thread = threading.Thread(target=self._load_all, name="model-loader", daemon=True)
+            self._thread.start()
+
+    def get(self, name, timeout=None):
+        """The loaded, warmed model; raises ModelNotReady if it is still loading after `timeout` or failed."""
+        entry = self._entries[name]
+        if not entry.done.is_set():
+            self.start()
+            if self.mode == "lazy":
+                self._load(entry)
+            elif not entry.done.wait(timeout):
+                raise ModelNotReady(f"Model {name} is still loading")
+        if entry.error is not None:
+            raise ModelNotReady(f"Model {name} failed to load: {entry.error}")
+        return entry.model
+
+    def peek(self, name):
+        """The model if it is already loaded, else None (never waits or loads)."""
+        entry = self._entries[name]
+        return entry.model if entry.warm else None
+
+    # ------------------------ status ------------------------
+    @property
+    def ready(self):
+        """Every model loaded and warmed (in lazy mode: nothing has failed so far)."""
+        if self.mode == "lazy":
+            return all(e.error is None for e in self._entries.values())
+        return all(e.done.is_set() and e.error is None for e in self._entries.values())
+
+    def status(self):
+        return {
+            "mode": self.mode,
+            "ready": self.ready,
+            "models": {
+                e.name: {
+                    "loaded": e.model is not None,
+                    "warm": e.warm,
+                    "loadMs": round(e.load_ms, 1) if e.load_ms is not None else None,
+                    "warmupMs": round(e.warmup_ms, 1) if e.warmup_ms is not None else None,
+                    "error": e.error,
+                }
+                for e in self._entries.values()
+            },
+        }
@@ -0,0 +1,94 @@
+# motion.py
+"""
+Motion model + detection cadence for the classroom loop.
+
+Classroom motion is slow, so the person detector only needs to run on
+keyframes. Between keyframes each track's box is propagated by a
+constant-velocity Kalman filter. DetectionScheduler picks the keyframe
+interval from the measured loop fps and from how fast the tracks move.
+"""
+
+import numpy as np
+
+# state: cx, cy, w, h, vx, vy, vw, vh (per frame)
+_F = np.eye(8)
+_F[:4, 4:] = np.eye(4)
+_H = np.eye(4, 8)
+
+
+class BoxKalman:
+    def __init__(self, bbox, pos_var=10.0, vel_var=100.0, process_var=1.0, meas_var=4.0):
+        x1, y1, x2, y2 = bbox
+        self.x = np.array([(x1 + x2) / 2.0, (y1 + y2) / 2.0, x2 - x1, y2 - y1, 0, 0, 0, 0], dtype=float)
+        self.P = np.diag([pos_var] * 4 + [vel_var] * 4)
+        self.Q = np.diag([process_var] * 4 + [process_var * 0.1] * 4)
+        self.R = np.eye(4) * meas_var
+
+    def predict(self):
+        self.x = _F @ self.x
+        self.P = _F @ self.P @ _F.T + self.Q
+        return self.bbox()
+
+    def correct(self, bbox):
+        x1, y1, x2, y2 = bbox
+        z = np.array([(x1 + x2) / 2.0, (y1 + y2) / 2.0, x2 - x1, y2 - y1], dtype=float)
+        S = _H @ self.P @ _H.T + self.R
+        K = self.P @ _H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - _H @ self.x)
+        self.P = (np.eye(8) - K @ _H) @ self.P
+
+    def hold(self):
+        """Stop extrapolating: zero the velocity (used while the track has no detections)."""
+        self.x[4:] = 0.0
+
+    def bbox(self):
+        cx, cy, w, h = self.x[:4]
+        w, h = max(w, 1.0), max(h, 1.0)
+        return (int(cx - w / 2), int(cy - h / 2), int(cx + w / 2), int(cy + h / 2))
+
+    def speed(self):
+        """Centroid speed relative to box size (box diagonals per frame)."""
+        diag = max(np.hypot(self.x[2], self.x[3]), 1.0)
+        return float(np.hypot(self.x[4], self.x[5]) / diag)
+
+
+class DetectionScheduler:
+    def __init__(self, target_fps=25.0, min_interval=1, max_interval=8, motion_high=0.02):
+        """
+        target_fps: loop rate we want to sustain (usually the source fps)
+        motion_high: relative speed (box diagonals / frame) above which we detect every frame
+        """
+        self.target_fps = target_fps
+        self.min_interval = max(1, int(min_interval))
+        self.max_interval = max(self.min_interval, int(max_interval))
+        self.motion_high = motion_high
+        self.interval = self.min_interval
+        self.since_key = self.interval      # first frame is always a keyframe
+        self.keyframes = 0
+        self.predicted = 0
+
+    def should_detect(self, n_tracks):
+        if n_tracks == 0 or self.since_key >= self.interval:
+            self.since_key = 1
+            self.keyframes += 1
+            return True
+        self.since_key += 1
+        self.predicted += 1
+        return False
+
+    def observe(self, fps_est, motion):
+        """Adapt the interval at each keyframe from loop fps and track motion."""
+        if fps_est is None or self.since_key != 1:
+            return
+        if motion > self.motion_high:
+            self.interval = max(self.min_interval, self.interval // 2)
+        elif fps_est < 0.9 * self.target_fps:
+            self.interval = min(self.max_interval, self.interval + 1)
+        elif fps_est > 1.2 * self.target_fps and motion < 0.5 * self.motion_high:
+            self.interval = max(self.min_interval, self.interval - 1)
+
+
+def motion_level(tracks):
+    """Median relative speed over tracks that carry a Kalman filter."""
+    speeds = [t.kf.speed() for t in tracks if getattr(t, "kf", None) is not None]
+    return float(np.median(speeds)) if speeds else 0.0
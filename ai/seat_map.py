@@ -0,0 +1,117 @@
+# seat_map.py
+"""
+Online seat map for the "left seat" heuristic.
+
+Replaces periodic DBSCAN refits over an ever-growing centroid history. Each
+observed centroid either updates the running mean of the nearest seat within
+`eps` or opens a new seat. A seat is used once it has `min_samples`
+observations. Counts are capped so seats can drift slowly, and the number of
+seats is bounded, so memory and per-update cost stay flat over a whole exam.
+Nearest-seat lookups use a KD-tree (scipy) rebuilt only when the seats
+change, with a NumPy brute-force fallback. The map can be saved per room and
+loaded at startup.
+"""
+
+import os
+import json
+import logging
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # optional dependency
+    cKDTree = None
+
+
+class SeatMap:
+    def __init__(self, eps=100.0, min_samples=3, max_seats=256, max_count=50):
+        self.eps = float(eps)
+        self.min_samples = min_samples
+        self.max_seats = max_seats
+        self.max_count = max_count
+        self.centers = np.zeros((0, 2), dtype=float)
+        self.counts = np.zeros(0, dtype=float)
+        self.frame_size = None
+        self._index = None          # (tree or None, confirmed centers)
+
+    # ------------------------ learning ------------------------
+    def observe(self, points):
+        """Fold a batch of centroids into the map."""
+        for p in np.asarray(points, dtype=float).reshape(-1, 2):
+            if len(self.centers):
+                d = np.hypot(self.centers[:, 0] - p[0], self.centers[:, 1] - p[1])
+                k = int(np.argmin(d))
+                if d[k] <= self.eps:
+                    n = min(self.counts[k], self.max_count - 1)
+                    self.centers[k] = (self.centers[k] * n + p) / (n + 1)
+                    self.counts[k] = n + 1
+                    continue
+            if len(self.centers) >= self.max_seats:
+                # evict the weakest seat to stay bounded
+                k = int(np.argmin(self.counts))
+                self.centers = np.delete(self.centers, k, axis=0)
+                self.counts = np.delete(self.counts, k)
+            self.centers = np.vstack([self.centers, p[None, :]])
+            self.counts = np.append(self.counts, 1.0)
+        self._index = None
+
+    @property
+    def seats(self):
+        return self.centers[self.counts >= self.min_samples]
+
+    # ------------------------ lookup ------------------------
+    def _build_index(self):
+        seats = self.seats
+        tree = cKDTree(seats) if cKDTree is not None and len(seats) else None
+        self._index = (tree, seats)
+        return self._index
+
+    def nearest_distance(self, points):
+        """Distance from each point to its nearest confirmed seat (inf when there are none)."""
+        pts = np.asarray(points, dtype=float).reshape(-1, 2)
+        tree, seats = self._index or self._build_index()
+        if len(seats) == 0 or len(pts) == 0:
+            return np.full(len(pts), np.inf)
+        if tree is not None:
+            d, _ = tree.query(pts, k=1)
+            return d
+        diff = pts[:, None, :] - seats[None, :, :]
+        return np.sqrt((diff ** 2).sum(axis=2)).min(axis=1)
+
+    # ------------------------ persistence ------------------------
+    def set_frame_size(self, w, h):
+        """Rescale a loaded map if the camera resolution changed."""
+        if self.frame_size and tuple(self.frame_size) != (w, h) and len(self.centers):
+            sx, sy = w / self.frame_size[0], h / self.frame_size[1]
+            self.centers = self.centers * np.array([sx, sy])
+            self._index = None
+        self.frame_size = (w, h)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        data = {
+            "frame_size": list(self.frame_size) if self.frame_size else None,
+            "eps": self.eps,
+            "seats": [[float(x), float(y), float(c)] for (x, y), c in zip(self.centers, self.counts)],
+        }
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            seats = np.array(data.get("seats", []), dtype=float).reshape(-1, 3)
+            self.centers = seats[:, :2].copy()
+            self.counts = seats[:, 2].copy()
+            self.frame_size = tuple(data["frame_size"]) if data.get("frame_size") else None
+            self._index = None
+            return True
+        except Exception as e:
+            logging.warning(f"Could not load seat map {path}: {e}")
+            return False
@@ -0,0 +1,96 @@
+# session_registry.py
+"""
+Per-session tracker state for the Flask AI service.
+
+Each exam room / camera posts frames under its own session id and gets its own
+AppearanceTracker and frame counter. The registry lock is only held for
+dictionary bookkeeping; frames of one session are serialised by that session's
+own lock, so different rooms are processed concurrently. Idle sessions are
+evicted by TTL, and least-recently-used sessions are dropped when the total
+number of live tracks exceeds the memory budget.
+"""
+
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class SessionState:
+    def __init__(self, key, tracker):
+        self.key = key
+        self.tracker = tracker
+        self.frame_index = 0
+        self.lock = threading.Lock()
+        self.users = 0                  # threads holding / waiting on this session
+        self.last_used = time.monotonic()
+
+    def track_count(self):
+        return len(self.tracker.tracks)
+
+
+class TrackerRegistry:
+    def __init__(self, tracker_factory, ttl_seconds=900.0, max_total_tracks=5000):
+        self.tracker_factory = tracker_factory
+        self.ttl = ttl_seconds
+        self.max_total_tracks = max_total_tracks
+        self._sessions = OrderedDict()  # key -> SessionState, least recently used first
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evicted_ttl = 0
+        self.evicted_budget = 0
+
+    @contextmanager
+    def session(self, key):
+        """Check out the state for `key` (created on first use) with its lock held."""
+        with self._lock:
+            state = self._sessions.get(key)
+            if state is None:
+                state = SessionState(key, self.tracker_factory())
+                self._sessions[key] = state
+                self.created += 1
+            self._sessions.move_to_end(key)
+            state.users += 1
+
+        try:
+            with state.lock:
+                yield state
+        finally:
+            with self._lock:
+                state.users -= 1
+                state.last_used = time.monotonic()
+                self._evict_locked()
+
+    def _evict_locked(self):
+        now = time.monotonic()
+        for key, state in list(self._sessions.items()):
+            if state.users == 0 and now - state.last_used > self.ttl:
+                del self._sessions[key]
+                self.evicted_ttl += 1
+                logging.info(f"Evicted idle session {key}")
+
+        total = sum(s.track_count() for s in self._sessions.values())
+        if total <= self.max_total_tracks:
+            return
+        for key, state in list(self._sessions.items()):
+            if total <= self.max_total_tracks:
+                break
+            if state.users > 0:
+                continue
+            total -= state.track_count()
+            del self._sessions[key]
+            self.evicted_budget += 1
+            logging.info(f"Evicted session {key} (track budget {self.max_total_tracks} exceeded)")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "totalTracks": sum(s.track_count() for s in self._sessions.values()),
+                "maxTotalTracks": self.max_total_tracks,
+                "ttlSeconds": self.ttl,
+                "created": self.created,
+                "evictedIdle": self.evicted_ttl,
+                "evictedBudget": self.evicted_budget,
+            }
@@ -0,0 +1,137 @@
+# stage_metrics.py
+"""
+Low-overhead per-stage latency timers and counters.
+
+Timing a stage costs two perf_counter() calls and one append under a lock.
+Each stage keeps a rolling window of recent durations for percentiles, plus
+a count and a sum that only grow (for rates). Stages that run once per face
+can add up their time locally and record() it once per frame.
+
+snapshot() returns plain dicts, so worker processes can send theirs to the
+front end. render_prometheus() writes one or more snapshots in the
+Prometheus text format, so no client library is needed. summary() is the
+compact form used for /stats and structured logs.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class _Stage:
+    __slots__ = ("window", "count", "total", "max")
+
+    def __init__(self, size):
+        self.window = deque(maxlen=size)    # seconds
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class StageTimers:
+    def __init__(self, window=1024):
+        self.window = window
+        self._stages = {}
+        self._counters = {}     # (name, ((label, value), ...)) -> value
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def time(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - t0)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            s = self._stages.get(stage)
+            if s is None:
+                s = self._stages[stage] = _Stage(self.window)
+            s.window.append(seconds)
+            s.count += 1
+            s.total += seconds
+            if seconds > s.max:
+                s.max = seconds
+
+    def incr(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    # ------------------------ read-out ------------------------
+    def snapshot(self):
+        """{"stages": {stage: {count, sum, max, quantiles}}, "counters": [[name, labels, value]]} (seconds)."""
+        with self._lock:
+            stages = {name: (list(s.window), s.count, s.total, s.max) for name, s in self._stages.items()}
+            counters = [[name, dict(labels), value] for (name, labels), value in self._counters.items()]
+        out = {}
+        for name, (window, count, total, mx) in stages.items():
+            q = np.quantile(np.array(window), QUANTILES) if window else np.zeros(len(QUANTILES))
+            out[name] = {"count": count, "sum": total, "max": mx,
+                         "quantiles": {str(k): float(v) for k, v in zip(QUANTILES, q)}}
+        return {"stages": out, "counters": counters}
+
+    def summary(self, snapshot=None):
+        """Milliseconds per stage: count, avg, p50, p90, p99 (avg over the process lifetime)."""
+        snap = snapshot or self.snapshot()
+        out = {}
+        for name, s in snap["stages"].items():
+            q = s["quantiles"]
+            out[name] = {"count": s["count"],
+                         "avgMs": round(s["sum"] * 1000.0 / s["count"], 3) if s["count"] else 0.0,
+                         "p50Ms": round(q["0.5"] * 1000.0, 3),
+                         "p90Ms": round(q["0.9"] * 1000.0, 3),
+                         "p99Ms": round(q["0.99"] * 1000.0, 3)}
+        return out
+
+
+# ------------------------ Prometheus text format ------------------------
+def _labels(labels):
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"' for k, v in labels.items())
+    return "{" + body + "}"
+
+
+def render_prometheus(snapshots, prefix="classtrack", gauges=None):
+    """
+    snapshots: [(labels dict, StageTimers.snapshot()), ...], e.g. one per worker process
+    gauges: [(name, labels dict, value), ...] sampled at scrape time
+    """
+    lines = []
+    name = f"{prefix}_stage_latency_seconds"
+    lines.append(f"# HELP {name} Per-stage processing latency (quantiles over a rolling window).")
+    lines.append(f"# TYPE {name} summary")
+    for base, snap in snapshots:
+        for stage, s in sorted(snap["stages"].items()):
+            labels = dict(base, stage=stage)
+            for q, v in s["quantiles"].items():
+                lines.append(f"{name}{_labels(dict(labels, quantile=q))} {v:.6f}")
+            lines.append(f"{name}_sum{_labels(labels)} {s['sum']:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {s['count']}")
+
+    counters = {}
+    for base, snap in snapshots:
+        for cname, labels, value in snap["counters"]:
+            counters.setdefault(cname, []).append((dict(base, **labels), value))
+    for cname, rows in sorted(counters.items()):
+        full = f"{prefix}_{cname}"
+        lines.append(f"# TYPE {full} counter")
+        for labels, value in rows:
+            lines.append(f"{full}{_labels(labels)} {value}")
+
+    by_name = {}
+    for gname, labels, value in gauges or []:
+        by_name.setdefault(gname, []).append((labels, value))     # samples of one metric must be contiguous
+    for gname, rows in sorted(by_name.items()):
+        full = f"{prefix}_{gname}"
+        lines.append(f"# TYPE {full} gauge")
+        for labels, value in rows:
+            lines.append(f"{full}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
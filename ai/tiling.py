@@ -0,0 +1,85 @@
+# tiling.py
+"""
+Run a detector at native resolution, on overlapping tiles for large frames.
+
+Both face detectors already letterbox their input to a fixed size
+(det_size / imgsz = 1280). Upscaling a small frame before calling them
+adds no detail; it only makes every later crop, histogram and encode
+larger. A frame much larger than the detector input goes the other way:
+it is squeezed down to 1280, and the small faces at the back of a lecture
+hall vanish. The tiler therefore passes small and mid-size frames through
+unchanged, and cuts large frames into overlapping detector-sized tiles.
+Boxes are mapped back to source-image coordinates.
+
+Every tile is a full detector pass, so only frames above `slack` x the
+detector size are tiled: with tile=1280 and the default slack of 2, 1080p
+and 1440p cameras keep a single pass and 4K is split into 8 tiles.
+
+A face cut by a tile border also appears whole in the neighbouring tile,
+as long as it is smaller than the overlap. Boxes that touch an interior
+border are therefore dropped rather than merged.
+"""
+
+import math
+
+
+def tile_starts(length, tile, overlap):
+    """Evenly spaced start offsets covering [0, length) with windows of `tile` overlapping >= `overlap`."""
+    if length <= tile:
+        return [0]
+    n = math.ceil((length - overlap) / (tile - overlap))
+    step = (length - tile) / (n - 1)
+    return [int(round(i * step)) for i in range(n)]
+
+
+def plan_tiles(width, height, tile=1280, overlap=256, slack=2.0):
+    """
+    Windows (x1, y1, x2, y2) to run the detector on.
+    A frame within `slack` x tile on both sides is run whole: the detector's own
+    downscale costs little detail there, and one pass is much cheaper than several.
+    """
+    if not tile or (width <= tile * slack and height <= tile * slack):
+        return [(0, 0, width, height)]
+    tw, th = min(tile, width), min(tile, height)
+    return [(x, y, x + tw, y + th)
+            for y in tile_starts(height, th, overlap)
+            for x in tile_starts(width, tw, overlap)]
+
+
+class TiledDetector:
+    def __init__(self, detect_fn, tile=1280, overlap=256, slack=2.0, border=2, detect_many=None):
+        """
+        detect_fn: img -> (boxes, scores), boxes as (x1, y1, x2, y2) in img coordinates
+        tile: tile edge in pixels (ideally the detector's input size); 0 disables tiling
+        detect_many: optional [img] -> [(boxes, scores)] for batching detectors; gets all tiles of a frame at once
+        """
+        self.detect_fn = detect_fn
+        self.detect_many = detect_many
+        self.tile = tile
+        self.overlap = overlap
+        self.slack = slack
+        self.border = border
+
+    def __call__(self, img):
+        h, w = img.shape[:2]
+        windows = plan_tiles(w, h, self.tile, self.overlap, self.slack)
+        if len(windows) == 1:
+            return self.detect_fn(img)
+
+        crops = [img[ty1:ty2, tx1:tx2] for (tx1, ty1, tx2, ty2) in windows]
+        if self.detect_many is not None:
+            results = self.detect_many(crops)
+        else:
+            results = [self.detect_fn(crop) for crop in crops]
+
+        boxes, scores = [], []
+        b = self.border
+        for (tx1, ty1, tx2, ty2), (tile_boxes, tile_scores) in zip(windows, results):
+            for (x1, y1, x2, y2), s in zip(tile_boxes, tile_scores):
+                # cut by a border shared with another tile -> the neighbour has the whole face
+                if (tx1 > 0 and x1 <= b) or (ty1 > 0 and y1 <= b) \
+                        or (tx2 < w and x2 >= tx2 - tx1 - b) or (ty2 < h and y2 >= ty2 - ty1 - b):
+                    continue
+                boxes.append((x1 + tx1, y1 + ty1, x2 + tx1, y2 + ty1))
+                scores.append(s)
+        return boxes, scores
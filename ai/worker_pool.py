@@ -0,0 +1,238 @@
+# worker_pool.py
+"""
+Pool of inference worker processes behind the HTTP front end.
+
+Each worker process has its own models, trackers and a few request threads.
+Requests are routed by session key with a stable hash, so a session always
+lands on the same worker and its tracker state never has to move. Every worker
+takes at most `max_inflight` frames at a time. Beyond that, submit() raises
+Overloaded right away and the front end sheds load instead of letting
+latency grow without bound. A worker that dies is restarted on the next
+request routed to it; its in-flight requests fail.
+
+A request that times out still counts against its worker until the late
+reply arrives (or the worker is replaced), since the worker is still busy
+with it. Restarts never fork: by then the front end runs server threads, so
+a replacement is started from a clean forkserver (or spawn) interpreter.
+"""
+
+import zlib
+import queue
+import threading
+import itertools
+import logging
+import multiprocessing as mp
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+
+class Overloaded(Exception):
+    pass
+
+
+class WorkerError(Exception):
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind        # exception class name raised inside the worker
+
+
+def _worker_main(index, handler, init, threads, inbox, outbox):
+    if init is not None:
+        init(index)
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"worker{index}")
+
+    def run(req_id, kind, payload):
+        try:
+            outbox.put((req_id, True, handler(kind, payload)))
+        except Exception as e:
+            if not isinstance(e, Overloaded):
+                logging.exception(f"Worker {index} failed on {kind}")
+            outbox.put((req_id, False, (type(e).__name__, str(e))))
+
+    while True:
+        msg = inbox.get()
+        if msg is None:
+            break
+        req_id, kind, payload, control = msg
+        if control:
+            # health / stats probes are answered here, never queued behind inference work
+            run(req_id, kind, payload)
+        else:
+            executor.submit(run, req_id, kind, payload)
+    executor.shutdown(wait=True)
+
+
+class _Worker:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.inbox = None
+        self.inflight = 0
+        self.served = 0
+        self.shed = 0
+        self.restarts = 0
+        self.restart_lock = threading.Lock()
+
+
+class WorkerPool:
+    def __init__(self, handler, workers=2, threads=2, max_inflight=4, init=None, timeout=30.0, start_method=None):
+        """
+        handler(kind, payload) -> result, run inside a worker process on one of its `threads` threads
+        init(index): one-off set-up inside each worker process (thread limits, model loading)
+        start_method: "fork" shares preloaded weights copy-on-write; "spawn" starts clean interpreters
+                      (restarts always use forkserver or spawn)
+        """
+        self.handler = handler
+        self.init = init
+        self.threads = max(1, threads)
+        self.max_inflight = max(1, max_inflight)
+        self.timeout = timeout
+        self._ctx = mp.get_context(start_method) if start_method else mp.get_context()
+        self._restart_ctx = self._ctx
+        if self._ctx.get_start_method() == "fork":
+            # forking a multithreaded process can copy locks held by other threads
+            clean = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+            self._restart_ctx = mp.get_context(clean)
+        # queues come from the restart context so a replacement worker can inherit them as well
+        self._outbox = self._restart_ctx.Queue()
+        self._workers = [_Worker(i) for i in range(max(1, workers))]
+        self._pending = {}          # req_id -> (worker index, Future, counted)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        self._closed = False
+
+    # ------------------------ lifecycle ------------------------
+    def _spawn(self, w, ctx):
+        """Start a worker process; returns (process, inbox) without touching `w`."""
+        inbox = self._restart_ctx.Queue()
+        process = ctx.Process(target=_worker_main, name=f"inference-worker-{w.index}", daemon=True,
+                              args=(w.index, self.handler, self.init, self.threads, inbox, self._outbox))
+        process.start()
+        return process, inbox
+
+    def start(self):
+        for w in self._workers:
+            w.process, w.inbox = self._spawn(w, self._ctx)
+        self._dispatcher = threading.Thread(target=self._dispatch, name="worker-results", daemon=True)
+        self._dispatcher.start()
+        print(f"Started {len(self._workers)} inference workers ({self.threads} threads, {self.max_inflight} in flight each)")
+
+    def close(self):
+        self._closed = True
+        for w in self._workers:
+            if w.process is not None and w.process.is_alive():
+                w.inbox.put(None)
+        for w in self._workers:
+            if w.process is not None:
+                w.process.join(timeout=5)
+
+    def _check_alive(self, w):
+        """
+        Restart a dead worker and fail whatever it had in flight. Called without the pool lock:
+        the replacement starts outside it and is swapped in together with failing the old requests.
+        """
+        if self._closed or w.process.is_alive():
+            return
+        with w.restart_lock:
+            if w.process.is_alive():
+                return      # another thread already replaced it
+            logging.warning(f"Inference worker {w.index} exited ({w.process.exitcode}), restarting")
+            process, inbox = self._spawn(w, self._restart_ctx)
+            failed = []
+            with self._lock:
+                for req_id, (idx, fut, _) in list(self._pending.items()):
+                    if idx == w.index:
+                        del self._pending[req_id]
+                        failed.append(fut)
+                w.process, w.inbox = process, inbox
+                w.inflight = 0
+                w.restarts += 1
+        for fut in failed:
+            fut.set_exception(WorkerError("WorkerDied", f"worker {w.index} exited"))
+
+    def _dispatch(self):
+        while not self._closed:
+            try:
+                req_id, ok, value = self._outbox.get(timeout=1.0)
+            except queue.Empty:
+                for w in self._workers:
+                    self._check_alive(w)
+                continue
+            with self._lock:
+                entry = self._pending.pop(req_id, None)
+                if entry is not None and entry[2]:
+                    # the worker is free of this request only now, even if its caller gave up
+                    w = self._workers[entry[0]]
+                    w.inflight = max(0, w.inflight - 1)
+                    w.served += 1
+            if entry is None:
+                continue
+            fut = entry[1]
+            if ok:
+                fut.set_result(value)
+            else:
+                fut.set_exception(WorkerError(*value))
+
+    # ------------------------ requests ------------------------
+    def worker_for(self, key):
+        return zlib.crc32(str(key).encode("utf-8")) % len(self._workers)
+
+    def _send(self, w, kind, payload, counted):
+        fut = Future()
+        req_id = next(self._ids)
+        self._check_alive(w)
+        with self._lock:
+            if counted:
+                if w.inflight >= self.max_inflight:
+                    w.shed += 1
+                    raise Overloaded(f"worker {w.index} is saturated")
+                w.inflight += 1
+            self._pending[req_id] = (w.index, fut, counted)
+            inbox = w.inbox
+        inbox.put((req_id, kind, payload, not counted))
+        return req_id, fut
+
+    def _wait(self, w, req_id, fut, counted, timeout):
+        try:
+            return fut.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            if not counted:
+                with self._lock:
+                    self._pending.pop(req_id, None)
+            # a counted request stays pending: its late reply releases the worker's in-flight slot
+            raise TimeoutError(f"worker {w.index} did not answer in time")
+
+    def submit(self, key, kind, payload, timeout=None):
+        """Run handler(kind, payload) on the worker owning `key`; raises Overloaded when it is saturated."""
+        w = self._workers[self.worker_for(key)]
+        req_id, fut = self._send(w, kind, payload, counted=True)
+        return self._wait(w, req_id, fut, True, timeout)
+
+    def call_all(self, kind, payload=None, timeout=5.0):
+        """
+        Control call on every worker; None for workers that fail. Not subject to load shedding, and
+        answered by the worker's inbox loop, so it must be cheap and never wait on a frame.
+        """
+        sent = [(w,) + self._send(w, kind, payload, counted=False) for w in self._workers]
+        out = []
+        for w, req_id, fut in sent:
+            try:
+                out.append(self._wait(w, req_id, fut, False, timeout))
+            except Exception as e:
+                logging.warning(f"Worker {w.index} {kind} call failed: {e}")
+                out.append(None)
+        return out
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": len(self._workers),
+                "threadsPerWorker": self.threads,
+                "maxInflight": self.max_inflight,
+                "perWorker": [
+                    {"index": w.index, "pid": w.process.pid if w.process else None,
+                     "alive": bool(w.process and w.process.is_alive()), "inflight": w.inflight,
+                     "served": w.served, "shed": w.shed, "restarts": w.restarts}
+                    for w in self._workers
+                ],
+            }
@@ -323,6 +323,7 @@ export const captureFrame = async (req, res) => {
     // Send frame to Flask AI
     const flaskRes = await axios.post("http://127.0.0.1:5001/camera/upload", {
       image,
+      sessionId,
     });
     const data = flaskRes.data;
 
@@ -16,6 +16,7 @@ export const captureFrame = async (req, res) => {
     // Send frame to Flask AI service
     const flaskRes = await axios.post("http://localhost:5001/camera/upload", {
       image,
+      sessionId: id,
     });
 
     const { faces_detected, boxes } = flaskRes.data;
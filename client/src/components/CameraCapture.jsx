@@ -1,14 +1,84 @@
-import { useRef } from "react";
+import { useEffect, useRef, useState } from "react";
 import Webcam from "react-webcam";
 
-export default function CameraCapture({ onCapture }) {
+const AI_STREAM_URL =
+  process.env.REACT_APP_AI_STREAM_URL || "ws://localhost:5001/camera/stream";
+
+// Frames sent but not yet answered; beyond this we skip captures instead of queueing them.
+const MAX_IN_FLIGHT = 2;
+
+export default function CameraCapture({
+  onCapture,
+  sessionId,
+  onResult,
+  fps = 2,
+  streamUrl = AI_STREAM_URL,
+}) {
   const webcamRef = useRef(null);
+  const socketRef = useRef(null);
+  const inFlightRef = useRef(0);
+  // latest callback without reopening the socket when a parent passes an inline function
+  const onResultRef = useRef(onResult);
+  onResultRef.current = onResult;
+  const [streaming, setStreaming] = useState(false);
+  const [status, setStatus] = useState(null);
 
   const capture = () => {
     const imageSrc = webcamRef.current.getScreenshot();
     if (onCapture) onCapture(imageSrc);
   };
 
+  // Persistent channel: binary JPEG frames in, one JSON result per processed frame out.
+  useEffect(() => {
+    if (!streaming || !sessionId) return undefined;
+
+    const ws = new WebSocket(
+      `${streamUrl}?sessionId=${encodeURIComponent(sessionId)}&response=lean`
+    );
+    ws.binaryType = "arraybuffer";
+    socketRef.current = ws;
+    inFlightRef.current = 0;
+
+    ws.onopen = () => setStatus("connected");
+    ws.onclose = () => setStatus("disconnected");
+    ws.onerror = () => setStatus("error");
+    ws.onmessage = (event) => {
+      // the server answers the newest frame only, so one message may settle several sends
+      const msg = JSON.parse(event.data);
+      inFlightRef.current = 0;
+      if (msg.type === "result") {
+        setStatus(`frame ${msg.frame} · ${msg.latencyMs} ms · dropped ${msg.dropped}`);
+        if (onResultRef.current) onResultRef.current(msg);
+      } else if (msg.type === "busy") {
+        setStatus("server busy");
+      } else if (msg.type === "error") {
+        setStatus(msg.error);
+      }
+    };
+
+    const timer = setInterval(() => {
+      const canvas = webcamRef.current && webcamRef.current.getCanvas();
+      if (!canvas || ws.readyState !== WebSocket.OPEN) return;
+      // client-side backpressure: never let frames pile up in the socket buffer
+      if (ws.bufferedAmount > 0 || inFlightRef.current >= MAX_IN_FLIGHT) return;
+      canvas.toBlob(
+        (blob) => {
+          if (!blob || ws.readyState !== WebSocket.OPEN) return;
+          inFlightRef.current += 1;
+          ws.send(blob);
+        },
+        "image/jpeg",
+        0.8
+      );
+    }, 1000 / fps);
+
+    return () => {
+      clearInterval(timer);
+      ws.close();
+      socketRef.current = null;
+    };
+  }, [streaming, sessionId, fps, streamUrl]);
+
   return (
     <div className="p-6">
       <h2 className="text-lg font-bold mb-2">📷 Live Camera</h2>
@@ -19,14 +89,27 @@ export default function CameraCapture({ onCapture }) {
         width={400}
         videoConstraints={{ facingMode: "user" }}
       />
-      <div className="mt-3">
+      <div className="mt-3 flex gap-2">
         <button
           onClick={capture}
           className="px-4 py-2 bg-blue-600 text-white rounded"
         >
           Capture Image
         </button>
+        {sessionId && (
+          <button
+            onClick={() => setStreaming((s) => !s)}
+            className={`px-4 py-2 text-white rounded ${
+              streaming ? "bg-red-600" : "bg-green-600"
+            }`}
+          >
+            {streaming ? "Stop Live Stream" : "Start Live Stream"}
+          </button>
+        )}
       </div>
+      {streaming && status && (
+        <p className="mt-2 text-sm text-gray-600">{status}</p>
+      )}
     </div>
   );
 }